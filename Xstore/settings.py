@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -134,7 +136,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Django REST Framework Settings
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",  # Enable JWT
+        # JWT; builds request.user from token claims (see shop/authentication.py)
+        "shop.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",  # Require authentication by default
@@ -146,12 +149,14 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 5,
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",  # Throttling for anonymous users
-        "rest_framework.throttling.UserRateThrottle",  # Throttling for authenticated users
+        # Token buckets shared by all workers on the host (see shop/throttling.py)
+        "shop.throttling.AnonBucketThrottle",  # Throttling for anonymous users
+        "shop.throttling.UserBucketThrottle",  # Throttling for authenticated users
     ],
     "DEFAULT_THROTTLE_RATES": {
         "anon": "10/min",  # Max 10 requests per minute for anonymous users
         "user": "100/hour",  # Max 100 requests per hour for logged-in users
+        "login": "5/min",  # Login attempts per IP, counted apart from "anon"
     },
 }
 
@@ -163,6 +168,74 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": "strong-key",
+    # Issue tokens carrying the claims ClaimsJWTAuthentication reads.
+    "TOKEN_OBTAIN_SERIALIZER": "shop.authentication.ClaimsTokenObtainPairSerializer",
+    # Revoke rotated refresh tokens (see shop/blacklist.py).
+    "TOKEN_REFRESH_SERIALIZER": "shop.authentication.ClaimsTokenRefreshSerializer",
+    "TOKEN_VERIFY_SERIALIZER": "shop.authentication.ClaimsTokenVerifySerializer",
+}
+
+# Shared throttle state (see shop/throttling.py)
+THROTTLE_STORE = {
+    "PATH": Path(tempfile.gettempdir()) / "xstore-throttle.sqlite3",
+    "BUSY_TIMEOUT": 0.05,  # seconds; past this the throttle's fail_open decides
+    "IDLE_EXPIRY": 86400,  # seconds
+}
+
+# Revoked refresh tokens (see shop/blacklist.py)
+TOKEN_BLACKLIST = {
+    "SYNC_INTERVAL": 5,  # seconds; revocations from other processes show up after this
+    "REBUILD_INTERVAL": 3600,  # seconds; also purges expired rows
+    "ERROR_RATE": 0.01,
 }
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# How /media/ is served (see shop/media.py)
+MEDIA_SERVING = {
+    "BACKEND": "django",  # "django" (FileResponse), "x-accel-redirect" (nginx) or "x-sendfile"
+    "INTERNAL_PREFIX": "/protected-media/",  # nginx `internal` location aliasing MEDIA_ROOT
+    "MAX_AGE": 3600,  # seconds
+}
+
+# Stream every upload to a temporary file instead of buffering it in memory.
+FILE_UPLOAD_HANDLERS = ["django.core.files.uploadhandler.TemporaryFileUploadHandler"]
+
+# Profile picture variants (see shop/images.py)
+PROFILE_IMAGES = {
+    "SIZES": [64, 256],  # pixels, square
+    "WORKERS": 2,  # render processes
+}
+
+# Serve catalog and review GETs with the async views in shop/async_views.py.
+# Opt-in (XSTORE_ASYNC_READ_VIEWS=1), and only under ASGI: bench_read_path
+# measured it slower than the sync views.
+ASYNC_READ_VIEWS = os.environ.get("XSTORE_ASYNC_READ_VIEWS") == "1"
+
+# The product caches and the catalog version must be shared by every worker,
+# or an invalidation in one process never reaches the others. Redis when
+# XSTORE_REDIS_URL is set (needed for several hosts), otherwise files shared
+# by the workers on this host.
+if os.environ.get("XSTORE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["XSTORE_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(Path(tempfile.gettempdir()) / "xstore-cache"),
+        }
+    }
+
+# Product detail and listing caches (see shop/cache.py)
+PRODUCT_CACHE = {
+    "BACKEND": "django",  # "django" (CACHES[ALIAS]) or "local" (per-process LRU, one worker only)
+    "ALIAS": "default",  # also holds anonymous listing pages + catalog version
+    "MAX_SIZE": 1024,
+    "TIMEOUT": 300,  # seconds
+    "LISTING_TIMEOUT": 60,  # seconds
+}
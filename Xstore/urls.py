@@ -23,7 +23,8 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 from django.conf import settings
-from django.conf.urls.static import static
+
+from shop.media import serve_media
 
 
 from rest_framework import permissions
@@ -50,9 +51,13 @@ urlpatterns = [
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
 ]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 from django.urls import path, re_path
 
+# Media with ETag/Range support or an X-Accel-Redirect/X-Sendfile handoff (see shop/media.py)
+urlpatterns += [
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", serve_media, name="media"),
+]
+
 urlpatterns += [
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
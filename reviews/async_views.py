@@ -0,0 +1,32 @@
+"""Async version of the product review listing (see shop.async_views)."""
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.shortcuts import aget_object_or_404
+from rest_framework.permissions import IsAuthenticated
+
+from shop.async_views import AsyncAPIView
+from shop.models import Product
+
+from .models import Review
+from .pagination import ReviewCursorPagination
+from .serializers import ReviewSerializer
+
+
+class ProductReviewListView(AsyncAPIView):
+    """GET of reviews.views.product_review_list_create."""
+
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, product_id):
+        product = await aget_object_or_404(Product, id=product_id)
+        # Cached after the first call, so the serializer below won't query it.
+        content_type = await sync_to_async(ContentType.objects.get_for_model)(Product)
+
+        reviews = Review.objects.filter(content_type=content_type, object_id=product_id)
+        paginator = ReviewCursorPagination()
+        page = await paginator.apaginate_queryset(reviews, request)
+        serializer = ReviewSerializer(
+            page, many=True, context={"content_object": product}
+        )
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews.summary import rebuild_summaries
+from shop.cache import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = "Recompute every rating summary from the review table."
+
+    def handle(self, *args, **options):
+        written = rebuild_summaries()
+        # Cached listing pages embed ratings. Per-process detail caches
+        # pick the new numbers up when their TTL runs out.
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rating summaries."))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    # Same aggregation as reviews.summary.rebuild_summaries, on the
+    # historical models.
+    Review = apps.get_model("reviews", "Review")
+    RatingSummary = apps.get_model("reviews", "RatingSummary")
+    rows = (
+        Review.objects.values("content_type_id", "object_id")
+        .annotate(
+            count=Count("id"),
+            total=Sum("rating"),
+            **{f"star_{star}": Count("id", filter=Q(rating=star)) for star in range(1, 6)},
+        )
+        .order_by()
+    )
+    RatingSummary.objects.bulk_create(
+        [RatingSummary(**row) for row in rows.iterator()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reviews', '0003_review_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('star_1', models.PositiveIntegerField(default=0)),
+                ('star_2', models.PositiveIntegerField(default=0)),
+                ('star_3', models.PositiveIntegerField(default=0)),
+                ('star_4', models.PositiveIntegerField(default=0)),
+                ('star_5', models.PositiveIntegerField(default=0)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_rating_summary_object')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
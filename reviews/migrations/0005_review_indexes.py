@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_reviews(apps, schema_editor):
+    # Keep each user's first review of an object so the constraint can be
+    # added, then recount the summaries of the objects that lost reviews.
+    # Reviews without a user (from before 0003) never conflict and are kept.
+    Review = apps.get_model("reviews", "Review")
+    RatingSummary = apps.get_model("reviews", "RatingSummary")
+    keep = (
+        Review.objects.values("content_type", "object_id", "user")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    duplicates = Review.objects.filter(user__isnull=False).exclude(id__in=keep)
+    affected = set(duplicates.values_list("content_type_id", "object_id"))
+    if not affected:
+        return
+    duplicates.delete()
+
+    for content_type_id, object_id in affected:
+        counts = Review.objects.filter(
+            content_type_id=content_type_id, object_id=object_id
+        ).aggregate(
+            count=Count("id"),
+            total=Coalesce(Sum("rating"), 0),
+            **{f"star_{star}": Count("id", filter=Q(rating=star)) for star in range(1, 6)},
+        )
+        RatingSummary.objects.update_or_create(
+            content_type_id=content_type_id, object_id=object_id, defaults=counts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reviews', '0004_ratingsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at', 'id'], name='review_object_created_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'user'), name='unique_review_per_user'),
+        ),
+    ]
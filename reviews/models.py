@@ -6,7 +6,9 @@ from django.contrib.contenttypes.models import ContentType
 # Create your models here.
 
 class Review(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews') 
+    # Null for reviews written while 0002 had dropped the column; their
+    # authors are unknown, so they are kept but can't be edited.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews', null=True)
     rating = models.PositiveIntegerField()  # Example: 1 to 5 stars
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,5 +18,48 @@ class Review(models.Model):
     object_id = models.PositiveIntegerField()  # Reference model ID
     content_object = GenericForeignKey("content_type", "object_id")  # The actual object
 
+    class Meta:
+        indexes = [
+            # Per-object review listing, paged on (created_at, id).
+            models.Index(
+                fields=["content_type", "object_id", "created_at", "id"],
+                name="review_object_created_idx",
+            ),
+        ]
+        constraints = [
+            # One review per user per object; also serves the duplicate check.
+            models.UniqueConstraint(
+                fields=["content_type", "object_id", "user"],
+                name="unique_review_per_user",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.id} - {self.rating}"
+
+
+class RatingSummary(models.Model):
+    """
+    Running rating totals for one reviewed object, kept up to date by the
+    review views so listings don't have to aggregate Review rows.
+    """
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="unique_rating_summary_object"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id}: {self.count} ratings"
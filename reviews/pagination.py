@@ -0,0 +1,5 @@
+from shop.pagination import KeysetPagination
+
+
+class ReviewCursorPagination(KeysetPagination):
+    page_size = 20
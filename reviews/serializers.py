@@ -1,6 +1,36 @@
 from rest_framework import serializers
 from .models import Review
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import prefetch_related_objects
+
+
+class ReviewListSerializer(serializers.ListSerializer):
+    """
+    Resolves the reviewed objects for the whole list before rendering.
+
+    Reviews of `context["content_object"]` (e.g. the product from the URL)
+    get it attached directly; the rest are grouped by content type and
+    loaded with one query per type, so rendering N reviews costs a fixed
+    number of queries instead of two per review.
+    """
+
+    def to_representation(self, data):
+        reviews = list(data.all() if hasattr(data, "all") else data)
+        known = self.context.get("content_object")
+        key = None
+        if known is not None:
+            key = (ContentType.objects.get_for_model(known).id, known.pk)
+
+        unresolved = []
+        for review in reviews:
+            if (review.content_type_id, review.object_id) == key:
+                # Also caches content_type on the review.
+                review.content_object = known
+            else:
+                unresolved.append(review)
+        prefetch_related_objects(unresolved, "content_type", "content_object")
+
+        return super().to_representation(reviews)
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -33,6 +63,17 @@ class ReviewSerializer(serializers.ModelSerializer):
             "object_name", "user"
         ]
         read_only_fields = ["id", "created_at"]
+        list_serializer_class = ReviewListSerializer
+        # Uniqueness is enforced by unique_review_per_user at write time.
+        validators = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance is not None:
+            # A review stays on the object it was written for; moving it
+            # would leave both objects' RatingSummary rows wrong.
+            for name in ("content_type", "object_id"):
+                self.fields[name].read_only = True
 
     def get_content_object_type(self, obj):
         return obj.content_type.model  # returns 'product', 'blogpost', etc.
@@ -0,0 +1,110 @@
+"""
+Incremental maintenance of RatingSummary rows.
+
+Every review write adjusts the summary with a single F() UPDATE, and
+`with_rating_summary` exposes the summary on any queryset as one JSON
+column in the same SELECT, so listings need no extra queries.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, JSONField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import JSONObject
+
+from .models import RatingSummary, Review
+
+STARS = range(1, 6)
+
+
+def _adjust(content_type_id, object_id, changes):
+    """Apply {field: +/-n} to the object's summary row, creating it if needed."""
+    with transaction.atomic():
+        summary, _ = RatingSummary.objects.get_or_create(
+            content_type_id=content_type_id, object_id=object_id
+        )
+        RatingSummary.objects.filter(id=summary.id).update(
+            **{field: F(field) + delta for field, delta in changes.items() if delta}
+        )
+
+
+def record_review(review):
+    _adjust(
+        review.content_type_id,
+        review.object_id,
+        {"count": 1, "total": review.rating, f"star_{review.rating}": 1},
+    )
+
+
+def change_review_rating(review, old_rating):
+    if review.rating == old_rating:
+        return
+    _adjust(
+        review.content_type_id,
+        review.object_id,
+        {
+            "total": review.rating - old_rating,
+            f"star_{old_rating}": -1,
+            f"star_{review.rating}": 1,
+        },
+    )
+
+
+def remove_review(review):
+    _adjust(
+        review.content_type_id,
+        review.object_id,
+        {"count": -1, "total": -review.rating, f"star_{review.rating}": -1},
+    )
+
+
+def with_rating_summary(queryset):
+    """Annotate `rating_summary` (a dict, or None if never reviewed)."""
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    summary = RatingSummary.objects.filter(
+        content_type=content_type, object_id=OuterRef("pk")
+    ).values(
+        data=JSONObject(
+            count="count",
+            total="total",
+            **{f"star_{star}": f"star_{star}" for star in STARS},
+        )
+    )[:1]
+    return queryset.annotate(rating_summary=Subquery(summary, output_field=JSONField()))
+
+
+def summary_for(obj):
+    """Summary dict for a single object that wasn't annotated."""
+    content_type = ContentType.objects.get_for_model(obj)
+    return (
+        RatingSummary.objects.filter(content_type=content_type, object_id=obj.pk)
+        .values("count", "total", *[f"star_{star}" for star in STARS])
+        .first()
+    )
+
+
+def format_summary(summary):
+    if not summary or not summary["count"]:
+        return {"count": 0, "average": None, "histogram": {str(s): 0 for s in STARS}}
+    return {
+        "count": summary["count"],
+        "average": round(summary["total"] / summary["count"], 2),
+        "histogram": {str(star): summary[f"star_{star}"] for star in STARS},
+    }
+
+
+def rebuild_summaries():
+    """Recompute every summary from the Review table. Returns rows written."""
+    rows = (
+        Review.objects.values("content_type_id", "object_id")
+        .annotate(
+            count=Count("id"),
+            total=Sum("rating"),
+            **{f"star_{star}": Count("id", filter=Q(rating=star)) for star in STARS},
+        )
+        .order_by()
+    )
+    summaries = [RatingSummary(**row) for row in rows.iterator()]
+    with transaction.atomic():
+        RatingSummary.objects.all().delete()
+        RatingSummary.objects.bulk_create(summaries, batch_size=1000)
+    return len(summaries)
@@ -1,3 +1,205 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncRequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, force_authenticate
+
+from shop.models import Category, Product
+from shop.tests import isolate_stores
+
+from .async_views import ProductReviewListView
+from .models import RatingSummary, Review
+from .serializers import ReviewSerializer
+
+
+class RatingSummaryTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="critic", password="x")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="music")
+        self.product = Product.objects.create(
+            name="Guitar", description="Acoustic", price=200, stock=1, category=category
+        )
+        self.url = f"/reviews/products/{self.product.id}/reviews/"
+
+    def rating(self):
+        return self.client.get(f"/shop/product_detail/{self.product.id}").data["rating"]
+
+    def review(self, user, rating):
+        self.client.force_authenticate(user=user)
+        response = self.client.post(
+            self.url,
+            {"rating": rating, "content_type": "product", "object_id": self.product.id},
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data["id"]
+
+    def test_summary_follows_review_writes(self):
+        other = User.objects.create_user(username="fan", password="x")
+        review_id = self.review(self.user, 4)
+        self.review(other, 2)
+        self.assertEqual(self.rating()["count"], 2)
+        self.assertEqual(self.rating()["average"], 3.0)
+
+        self.client.force_authenticate(user=self.user)
+        self.client.put(f"{self.url}{review_id}/", {"rating": 5})
+        self.assertEqual(self.rating()["histogram"], {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1})
+
+        self.client.delete(f"{self.url}{review_id}/")
+        self.assertEqual(self.rating()["count"], 1)
+        self.assertEqual(self.rating()["average"], 2.0)
+
+    def test_update_cannot_move_a_review(self):
+        other_product = Product.objects.create(
+            name="Drum", description="Snare", price=90, stock=1, category=self.product.category
+        )
+        review_id = self.review(self.user, 1)
+        response = self.client.put(
+            f"{self.url}{review_id}/", {"rating": 2, "object_id": other_product.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        review = Review.objects.get(id=review_id)
+        self.assertEqual((review.object_id, review.rating), (self.product.id, 2))
+        self.assertEqual(self.rating()["count"], 1)
+
+    def test_reviews_without_an_author_are_kept_read_only(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        legacy = Review.objects.create(
+            rating=4, content_type=content_type, object_id=self.product.id
+        )
+        response = self.client.get(f"{self.url}{legacy.id}/")
+        self.assertIsNone(response.data["user"])
+        self.assertEqual(self.client.put(f"{self.url}{legacy.id}/", {"rating": 1}).status_code, 403)
+
+    def test_listing_exposes_rating_in_one_query(self):
+        self.review(self.user, 5)
+        self.client.get("/shop/product_create")  # warm connection feature checks
+        with self.assertNumQueries(2):  # count + page, ratings included
+            response = self.client.get("/shop/product_create")
+        self.assertEqual(response.data["results"][0]["rating"]["average"], 5.0)
+
+    def test_rebuild_command(self):
+        self.review(self.user, 3)
+        RatingSummary.objects.all().delete()
+        call_command("rebuild_rating_summaries", stdout=StringIO())
+        self.assertEqual(self.rating()["average"], 3.0)
+
+
+class ReviewListQueryTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.category = Category.objects.create(name="film")
+        self.product = Product.objects.create(
+            name="Camera", description="35mm", price=300, stock=1, category=self.category
+        )
+        self.product_type = ContentType.objects.get_for_model(Product)
+
+    def add_reviews(self, count, target):
+        content_type = ContentType.objects.get_for_model(target)
+        for i in range(count):
+            user = User.objects.create_user(username=f"r{target.pk}-{Review.objects.count()}")
+            Review.objects.create(
+                user=user, rating=4, content_type=content_type, object_id=target.pk
+            )
+        return user
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/reviews/products/{self.product.id}/reviews/")
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertTrue(all(r["object_name"] == "Camera" for r in results))
+        return len(queries)
+
+    def test_product_review_list_is_constant_in_queries(self):
+        user = self.add_reviews(2, self.product)
+        self.client.force_authenticate(user=user)
+        small = self.list_queries()
+        self.add_reviews(20, self.product)
+        self.assertEqual(self.list_queries(), small)
+
+    def test_mixed_targets_load_one_query_per_type(self):
+        self.add_reviews(3, self.product)
+        self.add_reviews(3, self.category)
+        reviews = Review.objects.all()
+        with self.assertNumQueries(4):  # reviews, content types, products, categories
+            data = ReviewSerializer(reviews, many=True).data
+        self.assertEqual(
+            sorted({review["object_name"] for review in data}), ["Camera", "Film"]
+        )
+
+
+class ReviewListPaginationTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="writer", password="x")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="games")
+        self.product = Product.objects.create(
+            name="Chess", description="Board", price=25, stock=1, category=category
+        )
+        self.url = f"/reviews/products/{self.product.id}/reviews/"
+
+    def test_reviews_are_cursor_paged_newest_first(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        for i in range(5):
+            Review.objects.create(
+                user=User.objects.create_user(username=f"player{i}"),
+                rating=3,
+                content_type=content_type,
+                object_id=self.product.id,
+            )
+        url = f"{self.url}?page_size=2"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids += [review["id"] for review in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 5)
+
+    def test_async_listing_matches_sync_listing(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        for i in range(3):
+            Review.objects.create(
+                user=User.objects.create_user(username=f"fan{i}"),
+                rating=i + 1,
+                content_type=content_type,
+                object_id=self.product.id,
+            )
+        url = f"{self.url}?page_size=2"
+        request = AsyncRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        view = ProductReviewListView.as_view()
+        response = async_to_sync(view)(request, product_id=self.product.id).render()
+
+        self.assertEqual(json.loads(response.content), json.loads(self.client.get(url).content))
+
+    def test_duplicate_review_is_a_conflict_without_precheck(self):
+        data = {"rating": 4, "content_type": "product", "object_id": self.product.id}
+        self.assertEqual(self.client.post(self.url, data).status_code, 201)
+
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Review.objects.count(), 1)
+        self.assertEqual(RatingSummary.objects.get().count, 1)
+
+    def test_other_integrity_errors_are_not_conflicts(self):
+        data = {"rating": 4, "content_type": "product", "object_id": self.product.id}
+        broken = IntegrityError("CHECK constraint failed")
+        with mock.patch("reviews.views.record_review", side_effect=broken):
+            with self.assertRaises(IntegrityError):
+                self.client.post(self.url, data)
+        self.assertFalse(Review.objects.exists())
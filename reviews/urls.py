@@ -7,13 +7,15 @@
 #     path("<int:review_id>/", update_delete_review),  # Update review
 # ]
 from django.urls import path
+from shop.async_views import route
+from .async_views import ProductReviewListView
 from .views import product_review_list_create, product_review_detail
 
 urlpatterns = [
     # Product-specific reviews
     path(
         "products/<int:product_id>/reviews/",
-        product_review_list_create,
+        route(product_review_list_create, ProductReviewListView),
         name="product-review-list",
     ),
     path(
@@ -4,10 +4,14 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.contenttypes.models import ContentType
 from .models import Review
+from .pagination import ReviewCursorPagination
 from .serializers import ReviewSerializer
 
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
+from shop.changes import products_changed
 from shop.models import Product
+from .summary import change_review_rating, record_review, remove_review
 
 # Product-specific review views
 @api_view(['GET', 'POST'])
@@ -23,33 +27,43 @@ def product_review_list_create(request, product_id):
             content_type=content_type,
             object_id=product_id
         )
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(reviews, request)
+        serializer = ReviewSerializer(
+            page, many=True, context={"content_object": product}
+        )
+        return paginator.get_paginated_response(serializer.data)
     
     # Handle POST request
     elif request.method == 'POST':
-        # Check for existing review
         content_type = ContentType.objects.get_for_model(Product)
-        if Review.objects.filter(
-            content_type=content_type,
-            object_id=product_id,
-            user=request.user
-        ).exists():
-            return Response(
-                {"error": "You already reviewed this product"},
-                status=status.HTTP_409_CONFLICT
-            )
-        
-        # Create new review
         serializer = ReviewSerializer(
             data=request.data,
             context={'request': request}
         )
         if serializer.is_valid():
-            serializer.save(
-                content_type=content_type,
-                object_id=product_id
-            )
+            # Duplicates are caught by the unique_review_per_user constraint
+            # instead of a pre-check query.
+            try:
+                with transaction.atomic():
+                    review = serializer.save(
+                        user=request.user,
+                        content_type=content_type,
+                        object_id=product_id
+                    )
+                    record_review(review)
+                    products_changed([product_id])
+            except IntegrityError:
+                # Only unique_review_per_user means a duplicate; anything
+                # else is a real error.
+                if not Review.objects.filter(
+                    content_type=content_type, object_id=product_id, user=request.user
+                ).exists():
+                    raise
+                return Response(
+                    {"error": "You already reviewed this product"},
+                    status=status.HTTP_409_CONFLICT
+                )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -85,13 +99,20 @@ def product_review_detail(request, product_id, review_id):
             partial=True
         )
         if serializer.is_valid():
-            serializer.save()
+            old_rating = review.rating
+            with transaction.atomic():
+                review = serializer.save()
+                change_review_rating(review, old_rating)
+                products_changed([product_id])
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     # Handle DELETE
     elif request.method == 'DELETE':
-        review.delete()
+        with transaction.atomic():
+            review.delete()
+            remove_review(review)
+            products_changed([product_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 # from rest_framework.decorators import api_view, permission_classes
 # from rest_framework.response import Response
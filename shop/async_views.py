@@ -0,0 +1,140 @@
+"""
+Async versions of the read-heavy catalog endpoints, for ASGI deployments.
+
+DRF function views are synchronous, so under ASGI every call is handed to
+a thread. The views here are coroutines: DRF's authentication, permission
+and throttle checks still run synchronously (in one `sync_to_async` hop),
+but the queries go through Django's async ORM and the response is built
+on the event loop. Responses are the same as the sync views in
+`shop.views`, which remain in use for writes and under WSGI.
+
+`route()` picks between the two when the URLconf is loaded: with
+`ASYNC_READ_VIEWS` on (XSTORE_ASYNC_READ_VIEWS=1) GET and HEAD go to the
+async view and every other method to the sync one. It is off by default:
+bench_read_path measured this path slower than the sync views, so enable
+it only where it has been measured to help.
+"""
+
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import aget_object_or_404
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from reviews.summary import with_rating_summary
+
+from .cache import (
+    aget_listing,
+    aget_product_payload,
+    alisting_cache_key,
+    aset_listing,
+)
+from .models import Category, Product
+from .pagination import AsyncPageNumberPagination, ProductCursorPagination
+from .permissions import IsAdminOrReadOnly
+from .serializer import CategorySerializer, ProductSerializer
+from .views import filter_products
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttling are sync-only in DRF.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def route(sync_view, async_view_class):
+    """
+    The view to mount for an endpoint with an async read path.
+
+    Returns `sync_view` unchanged unless settings.ASYNC_READ_VIEWS is on.
+    """
+    if not getattr(settings, "ASYNC_READ_VIEWS", False):
+        return sync_view
+
+    async_view = async_view_class.as_view()
+    threaded_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await async_view(request, *args, **kwargs)
+        return await threaded_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+class ProductListView(AsyncAPIView):
+    """GET of shop.views.product_create."""
+
+    permission_classes = [IsAdminOrReadOnly]
+
+    async def get(self, request):
+        cache_key = None
+        if not request.user.is_authenticated:
+            cache_key = await alisting_cache_key(request)
+            cached = await aget_listing(cache_key)
+            if cached is not None:
+                return Response(cached)
+
+        # Building the queryset may query the database once per process
+        # (content type, FTS probe), which the async ORM can't do for us.
+        queryset = await sync_to_async(filter_products)(request)
+
+        if "cursor" in request.GET or request.GET.get("pagination") == "cursor":
+            paginator = ProductCursorPagination()
+        else:
+            paginator = AsyncPageNumberPagination()
+        rows = await paginator.apaginate_queryset(queryset, request)
+
+        response = paginator.get_paginated_response(
+            ProductSerializer(rows, many=True).data
+        )
+        if cache_key:
+            await aset_listing(cache_key, response.data)
+        return response
+
+
+class ProductDetailView(AsyncAPIView):
+    """GET of shop.views.product_detail."""
+
+    permission_classes = [IsAdminOrReadOnly]
+
+    async def get(self, request, product_id):
+        async def load():
+            products = await sync_to_async(with_rating_summary)(
+                Product.objects.select_related("category")
+            )
+            product = await aget_object_or_404(products, id=product_id)
+            return dict(ProductSerializer(product).data)
+
+        return Response(await aget_product_payload(product_id, load))
+
+
+class CategoryListView(AsyncAPIView):
+    """GET of shop.views.category_list."""
+
+    permission_classes = [IsAdminOrReadOnly]
+
+    async def get(self, request):
+        categories = [category async for category in Category.objects.all()]
+        return Response(CategorySerializer(categories, many=True).data)
@@ -0,0 +1,140 @@
+"""
+Stateless JWT authentication.
+
+simplejwt's JWTAuthentication loads the User row on every request before
+the view runs. Most requests only need the user's id and `is_staff`
+(IsAdminOrReadOnly), so tokens issued here also carry `is_staff` and
+`is_active`, and ClaimsJWTAuthentication builds a ClaimsUser from them
+without touching the database. Anything else on the user is loaded on
+first access.
+
+Claims are only as fresh as the access token. A refresh reloads the
+user and writes the claims from the database onto both the new access
+token and the rotated refresh token, so a change to `is_staff` or
+`is_active` takes effect at the next refresh (at most
+ACCESS_TOKEN_LIFETIME later). Tokens issued before these claims existed
+fall back to the database lookup.
+
+Refresh tokens are ClaimsRefreshTokens, which check and record
+revocation in shop.blacklist: a refresh token used for rotation can't be
+used again, and /api/token/verify/ rejects it.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+from .blacklist import revocations
+from .models import ClaimsUser
+
+USER_CLAIMS = ("is_staff", "is_active")
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    RefreshToken whose access tokens carry the USER_CLAIMS and which can
+    be revoked through shop.blacklist.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    def verify(self, *args, **kwargs):
+        # Filter check only, so a refresh costs no extra query. A token
+        # rotated elsewhere but not yet synced here is refused by blacklist().
+        if revocations.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+        super().verify(*args, **kwargs)
+
+    def blacklist(self):
+        # Called on rotation. Of two concurrent refreshes with the same
+        # token only one insert succeeds; the other is refused here.
+        try:
+            revocations.revoke(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+        except IntegrityError:
+            raise TokenError(_("Token is blacklisted"))
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        user = (
+            get_user_model()
+            .objects.filter(
+                **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+            )
+            .first()
+        )
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+        # Fresh from the database, not copied from the old token, so a
+        # demoted user loses is_staff here. Set on the refresh token so the
+        # access token below and the rotated refresh token both carry them.
+        for claim in USER_CLAIMS:
+            refresh[claim] = getattr(user, claim)
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+
+        return data
+
+
+class ClaimsTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti and revocations.is_revoked(jti):
+            raise serializers.ValidationError(_("Token is blacklisted"))
+        return {}
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        claims = (api_settings.USER_ID_CLAIM, *USER_CLAIMS)
+        if any(claim not in validated_token for claim in claims):
+            return super().get_user(validated_token)
+
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        # simplejwt stores the user id as a string.
+        user_id = ClaimsUser._meta.get_field(api_settings.USER_ID_FIELD).to_python(
+            validated_token[api_settings.USER_ID_CLAIM]
+        )
+        return ClaimsUser.from_db(
+            router.db_for_read(ClaimsUser),
+            [api_settings.USER_ID_FIELD, *USER_CLAIMS],
+            [user_id, *(validated_token[claim] for claim in USER_CLAIMS)],
+        )
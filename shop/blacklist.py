@@ -0,0 +1,156 @@
+"""
+Revoked refresh tokens.
+
+Rotated refresh tokens are recorded in RevokedToken (JTI + expiry) until
+they would have expired anyway. Each process keeps a Bloom filter of the
+revoked JTIs: a token that isn't in the filter is known not to be revoked
+without a query, which is the case for almost every token checked. Filter
+hits (a revoked token, or a false positive) are confirmed with a primary
+key lookup.
+
+The filter picks up tokens revoked by other processes every
+SYNC_INTERVAL seconds, so such a token can still be accepted here for
+that long. That is fine for access and verify checks. Rotation needs
+more, since one refresh token must never yield two token pairs, and
+gets it without an extra read: `revoke` is a plain insert on the JTI
+primary key, so a token already rotated here, in another process or
+by a concurrent request fails with IntegrityError.
+
+Bloom filters can't forget, so every REBUILD_INTERVAL the filter is
+rebuilt from the table and expired rows are deleted.
+
+Configured by the TOKEN_BLACKLIST setting:
+
+    TOKEN_BLACKLIST = {
+        "SYNC_INTERVAL": 5,       # seconds
+        "REBUILD_INTERVAL": 3600, # seconds
+        "ERROR_RATE": 0.01,       # Bloom filter false-positive rate
+    }
+"""
+
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+DEFAULTS = {
+    "SYNC_INTERVAL": 5,
+    "REBUILD_INTERVAL": 3600,
+    "ERROR_RATE": 0.01,
+}
+
+MIN_CAPACITY = 10_000
+
+# Revocations are re-read this far back on every sync, so one committed
+# just after a sync started (with an earlier revoked_at) isn't missed.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "TOKEN_BLACKLIST", {})}
+
+
+def _key(jti):
+    return uuid.UUID(str(jti)).hex
+
+
+class RevocationList:
+    """The per-process view of RevokedToken."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the filter; the next check rebuilds it from the table."""
+        self._filter = None
+        self._built_at = self._synced_at = 0.0
+        self._watermark = None
+
+    def _refresh(self):
+        config = _config()
+        now = time.monotonic()
+        with self._lock:
+            if self._filter is None or now - self._built_at > config["REBUILD_INTERVAL"]:
+                self._rebuild(config)
+            elif now - self._synced_at > config["SYNC_INTERVAL"]:
+                self._sync()
+
+    def _rebuild(self, config):
+        started = timezone.now()
+        RevokedToken.objects.filter(expires_at__lte=started).delete()
+        live = RevokedToken.objects.filter(expires_at__gt=started)
+        bloom = BloomFilter(max(2 * live.count(), MIN_CAPACITY), config["ERROR_RATE"])
+        for jti in live.values_list("jti", flat=True).iterator(chunk_size=10_000):
+            bloom.add(jti.hex)
+        self._filter = bloom
+        self._watermark = started - SYNC_OVERLAP
+        self._built_at = self._synced_at = time.monotonic()
+
+    def _sync(self):
+        started = timezone.now()
+        for jti in RevokedToken.objects.filter(
+            revoked_at__gte=self._watermark
+        ).values_list("jti", flat=True):
+            self._filter.add(jti.hex)
+        self._watermark = started - SYNC_OVERLAP
+        self._synced_at = time.monotonic()
+
+    def revoke(self, jti, exp):
+        """
+        Revoke the token with this JTI until `exp` (a UNIX timestamp).
+        Raises IntegrityError if it was already revoked.
+        """
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=_key(jti), expires_at=datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+            )
+        self._refresh()
+        with self._lock:
+            self._filter.add(_key(jti))
+
+    def is_revoked(self, jti):
+        self._refresh()
+        key = _key(jti)
+        if key not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=key, expires_at__gt=timezone.now()).exists()
+
+
+revocations = RevocationList()
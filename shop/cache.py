@@ -0,0 +1,330 @@
+"""
+Caches for the product catalog.
+
+Product detail: `product_detail` GET reads through `get_product_payload`;
+every code path that changes a product (detail PUT/DELETE,
+ProductSerializer.update, stock changes in OrderSerializer) calls
+`invalidate_products`.
+
+Product listing: anonymous `product_create` GET responses are stored under
+a key made of the normalized query parameters plus a catalog version
+number. Any product, category or stock write bumps the version, so old
+entries are simply never looked up again and expire on their own.
+
+Each read helper has an `a`-prefixed twin for the async views.
+
+Both are configured by the PRODUCT_CACHE setting:
+
+    PRODUCT_CACHE = {
+        "BACKEND": "django",  # CACHES[ALIAS], or "local" for a per-process LRU
+        "ALIAS": "default",   # Django cache used for listings and the version
+        "MAX_SIZE": 1024,     # local backend only
+        "TIMEOUT": 300,       # seconds
+        "LISTING_TIMEOUT": 60,
+    }
+
+Invalidations and version bumps only reach the processes that share the
+cache, so with more than one worker both the "local" backend and a
+per-process CACHES[ALIAS] (LocMemCache) keep serving stale products for
+up to TIMEOUT and stale listings for up to LISTING_TIMEOUT. The
+shop.W001 system check warns about such a configuration.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULTS = {
+    "BACKEND": "django",
+    "ALIAS": "default",
+    "MAX_SIZE": 1024,
+    "TIMEOUT": 300,
+    "LISTING_TIMEOUT": 60,
+}
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_size=1024, timeout=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    async def aget(self, key, default=None):
+        # In-process and only briefly locked, so safe on the event loop.
+        return self.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class DjangoCache:
+    """Same interface on top of a configured Django cache alias."""
+
+    def __init__(self, alias="default", timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        value = self.backend.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    async def aget(self, key, default=None):
+        value = await self.backend.aget(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    async def aset(self, key, value):
+        await self.backend.aset(key, value, self.timeout)
+
+    def delete_many(self, keys):
+        self.backend.delete_many(list(keys))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        # Evictions happen inside the cache server and aren't visible here.
+        return {
+            "backend": "django",
+            "alias": self.alias,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": None,
+        }
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "PRODUCT_CACHE", {})}
+
+
+def _build_cache():
+    config = _config()
+    if config["BACKEND"] == "django":
+        return DjangoCache(alias=config["ALIAS"], timeout=config["TIMEOUT"])
+    return LRUCache(max_size=config["MAX_SIZE"], timeout=config["TIMEOUT"])
+
+
+product_cache = _build_cache()
+
+
+def product_key(product_id):
+    return f"shop:product:{product_id}"
+
+
+def get_product_payload(product_id, loader):
+    """
+    Return the cached payload for `product_id`, calling `loader()` to build
+    (and store) it on a miss. Exceptions from `loader` are not cached.
+    """
+    key = product_key(product_id)
+    payload = product_cache.get(key)
+    if payload is None:
+        payload = loader()
+        product_cache.set(key, payload)
+    return payload
+
+
+async def aget_product_payload(product_id, loader):
+    """get_product_payload for async views; `loader` is a coroutine function."""
+    key = product_key(product_id)
+    payload = await product_cache.aget(key)
+    if payload is None:
+        payload = await loader()
+        await product_cache.aset(key, payload)
+    return payload
+
+
+def invalidate_products(product_ids):
+    """
+    Drop cached payloads for the given products.
+
+    Entries are dropped right away and again once the surrounding
+    transaction commits, so a reader that refilled the cache with
+    pre-commit data in between does not leave it stale.
+    """
+    keys = [product_key(product_id) for product_id in set(product_ids)]
+    if not keys:
+        return
+    product_cache.delete_many(keys)
+    transaction.on_commit(lambda: product_cache.delete_many(keys))
+    bump_catalog_version()
+
+
+CATALOG_VERSION_KEY = "shop:catalog:version"
+
+LISTING_PARAMS = (
+    "min_price",
+    "max_price",
+    "category",
+    "name",
+    "search",
+    "page",
+    "pagination",
+    "cursor",
+    "ordering",
+    "page_size",
+)
+
+
+def _shared_cache():
+    return caches[_config()["ALIAS"]]
+
+
+def _fresh_version():
+    # Seeded from the clock so a version lost to eviction can never be
+    # reissued and match entries written before the loss.
+    return time.time_ns()
+
+
+def catalog_version():
+    backend = _shared_cache()
+    version = backend.get(CATALOG_VERSION_KEY)
+    if version is None:
+        backend.add(CATALOG_VERSION_KEY, _fresh_version(), None)
+        version = backend.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def acatalog_version():
+    backend = _shared_cache()
+    version = await backend.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await backend.aadd(CATALOG_VERSION_KEY, _fresh_version(), None)
+        version = await backend.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def _incr_catalog_version():
+    backend = _shared_cache()
+    try:
+        backend.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        backend.set(CATALOG_VERSION_KEY, _fresh_version(), None)
+
+
+def bump_catalog_version():
+    """
+    Retire every cached listing page.
+
+    Bumped now and again on commit, so pages rebuilt from pre-commit data
+    in between are filed under a version nobody reads any more.
+    """
+    _incr_catalog_version()
+    transaction.on_commit(_incr_catalog_version)
+
+
+def _normalize(name, value):
+    if name in ("min_price", "max_price"):
+        try:
+            return str(Decimal(value).normalize())
+        except InvalidOperation:
+            return value
+    if name in ("category", "name", "search"):
+        return " ".join(value.lower().split())
+    return value
+
+
+def _listing_digest(request):
+    parts = []
+    for name in LISTING_PARAMS:
+        value = request.GET.get(name, "").strip()
+        if value:
+            parts.append(f"{name}={_normalize(name, value)}")
+    return hashlib.sha1(
+        f"{request.get_host()}?{'&'.join(parts)}".encode()
+    ).hexdigest()
+
+
+def listing_cache_key(request):
+    """Key for a listing request: host + normalized filters + catalog version."""
+    return f"shop:listing:{catalog_version()}:{_listing_digest(request)}"
+
+
+async def alisting_cache_key(request):
+    return f"shop:listing:{await acatalog_version()}:{_listing_digest(request)}"
+
+
+def get_listing(key):
+    return _shared_cache().get(key)
+
+
+async def aget_listing(key):
+    return await _shared_cache().aget(key)
+
+
+def set_listing(key, data):
+    _shared_cache().set(key, data, _config()["LISTING_TIMEOUT"])
+
+
+async def aset_listing(key, data):
+    await _shared_cache().aset(key, data, _config()["LISTING_TIMEOUT"])
@@ -0,0 +1,37 @@
+"""
+Single place to announce catalog writes.
+
+`products_changed` / `categories_changed` drop the affected cache entries,
+retire cached listing pages and append to the CatalogChange log that backs
+the `catalog_changes` delta-sync feed. Every code path that writes products
+or categories (including stock moves and rating updates, which change the
+product payload) goes through here.
+"""
+
+from .cache import bump_catalog_version, invalidate_products
+from .models import CatalogChange
+
+
+def record_changes(entity, object_ids, deleted=False):
+    CatalogChange.objects.bulk_create(
+        [
+            CatalogChange(entity=entity, object_id=object_id, deleted=deleted)
+            for object_id in object_ids
+        ]
+    )
+
+
+def products_changed(product_ids, deleted=False):
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    invalidate_products(product_ids)
+    record_changes(CatalogChange.PRODUCT, product_ids, deleted)
+
+
+def categories_changed(category_ids, deleted=False):
+    category_ids = sorted(set(category_ids))
+    if not category_ids:
+        return
+    bump_catalog_version()
+    record_changes(CatalogChange.CATEGORY, category_ids, deleted)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core import checks
+
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_product_cache_is_shared(app_configs, **kwargs):
+    """The product caches are only coherent if every worker shares them."""
+    from .cache import _config
+
+    config = _config()
+    alias_backend = settings.CACHES.get(config["ALIAS"], {}).get("BACKEND")
+    if config["BACKEND"] == "local":
+        problem = 'PRODUCT_CACHE["BACKEND"] is "local"'
+    elif alias_backend in PER_PROCESS_CACHES:
+        problem = f'CACHES["{config["ALIAS"]}"] is {alias_backend.rsplit(".", 1)[-1]}'
+    else:
+        return []
+    return [
+        checks.Warning(
+            f"{problem}, so each worker process caches products on its own.",
+            hint=(
+                "Product invalidations won't reach other workers. Run a single worker, "
+                "or point PRODUCT_CACHE at a shared cache (Redis, Memcached, files)."
+            ),
+            id="shop.W001",
+        )
+    ]
@@ -0,0 +1,30 @@
+"""
+Case-insensitive email lookups on auth_user.
+
+Migration 0013 indexes LOWER(email) with a UNIQUE index that is partial
+on `email <> ''`, so any number of users can have no email. A query can
+only use a partial index when it repeats the index's condition verbatim,
+which `by_email` takes care of.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+EMAIL_INDEX_CONDITION = "auth_user.email <> ''"
+
+
+def by_email(queryset=None):
+    """`queryset` with an `email_lower` alias served by the email index."""
+    queryset = User.objects.all() if queryset is None else queryset
+    return queryset.alias(email_lower=Lower("email")).extra(where=[EMAIL_INDEX_CONDITION])
+
+
+def email_taken(email, exclude_user=None):
+    """True if another user already has `email`, ignoring case."""
+    # Lowercase on the database side too: SQLite's LOWER() only folds
+    # ASCII, and must agree with the index rather than with str.lower().
+    users = by_email().filter(email_lower=Lower(Value(email)))
+    if exclude_user is not None:
+        users = users.exclude(id=exclude_user.id)
+    return users.exists()
@@ -1,12 +1,16 @@
 import django_filters  # Ensure this line is present
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Product, Order
+from .search import search_products
 
 class ProductFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     max_price = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     category = django_filters.CharFilter(field_name="category__name", lookup_expr="iexact")  # Case-insensitive category filter
-    name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")  # Partial match search
+    name = django_filters.CharFilter(method="filter_name")  # Full-text match on name
+
+    def filter_name(self, queryset, name, value):
+        return search_products(queryset, value, column="name", ranked=False)
 
     class Meta:
         model = Product
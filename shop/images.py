@@ -0,0 +1,226 @@
+"""
+Profile picture storage and resized variants.
+
+Uploads arrive as temporary files (FILE_UPLOAD_HANDLERS only streams to
+disk) and are stored once per content: the file is named after its
+SHA-256, so re-uploading the same picture writes nothing. Fixed-size
+square variants in every VARIANT_FORMATS format are rendered in a
+process pool after the request's transaction commits. Until they exist
+`picture_ready` is False and the API exposes only the original.
+
+A pool whose worker died (say, killed for memory on a huge image) is
+replaced on the next upload. The job it was running is lost, as are jobs
+queued when the server stops; `manage.py render_profile_variants` renders
+whatever is missing, including pictures stored before variants existed.
+
+Configured by the PROFILE_IMAGES setting:
+
+    PROFILE_IMAGES = {
+        "SIZES": [64, 256],  # variant edge lengths in pixels
+        "WORKERS": 2,        # render processes; 0 renders inline (tests)
+    }
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+# Pool processes import this module before Django is set up, so models are
+# imported inside the functions that run in the web process.
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SIZES": [64, 256],
+    "WORKERS": 2,
+}
+
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+ORIGINALS_DIR = "user_image"
+VARIANTS_DIR = "user_image/variants"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "PROFILE_IMAGES", {})}
+
+
+def variant_name(digest, size, ext):
+    return f"{VARIANTS_DIR}/{digest[:2]}/{digest}_{size}.{ext}"
+
+
+def variant_urls(digest):
+    """{size: {format: url}} for a picture whose variants are ready."""
+    return {
+        str(size): {ext: default_storage.url(variant_name(digest, size, ext)) for ext in VARIANT_FORMATS}
+        for size in _config()["SIZES"]
+    }
+
+
+def content_hash(file):
+    """Hex SHA-256 of a Django File, read in chunks."""
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def store_upload(uploaded):
+    """
+    Store an uploaded picture under its content hash, reading it in
+    chunks. Returns (storage name, hex digest).
+    """
+    digest = content_hash(uploaded)
+
+    image = getattr(uploaded, "image", None)  # set by ImageField validation
+    ext = (image.format.lower() if image and image.format else "") or (
+        PurePosixPath(uploaded.name).suffix.lstrip(".").lower()
+    )
+    name = f"{ORIGINALS_DIR}/{digest[:2]}/{digest}.{ext or 'img'}"
+    if not default_storage.exists(name):
+        uploaded.seek(0)
+        name = default_storage.save(name, uploaded)
+    return name, digest
+
+
+def attach_picture(profile, uploaded):
+    """Store `uploaded` as `profile`'s picture and queue its variants."""
+    from .models import UserProfile
+
+    name, digest = store_upload(uploaded)
+    profile.profile_picture = name
+    profile.picture_hash = digest
+    # Same content uploaded before: its variants already exist.
+    profile.picture_ready = UserProfile.objects.filter(
+        picture_hash=digest, picture_ready=True
+    ).exists()
+    profile.save()
+    if not profile.picture_ready:
+        # robust: a failure to queue is logged, never turned into a 500 for
+        # a request whose rows are already committed.
+        transaction.on_commit(lambda: schedule_variants(name, digest), robust=True)
+
+
+def render_variants(source_name, digest, sizes):
+    """Write every missing variant of `source_name`. Runs in a pool process."""
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source_name) as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size in sizes:
+            thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            for ext, fmt in VARIANT_FORMATS.items():
+                name = variant_name(digest, size, ext)
+                if default_storage.exists(name):
+                    continue
+                buffer = BytesIO()
+                thumb.save(buffer, fmt, quality=85)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+    return digest
+
+
+def _mark_ready(digest):
+    from .models import UserProfile
+
+    UserProfile.objects.filter(picture_hash=digest).update(picture_ready=True)
+
+
+def render_now(source_name, digest):
+    """Render the variants in this process and mark the picture ready."""
+    render_variants(source_name, digest, _config()["SIZES"])
+    _mark_ready(digest)
+
+
+def _on_rendered(pool, future):
+    # Runs on the pool's management thread, outside any request.
+    try:
+        _mark_ready(future.result())
+    except BrokenProcessPool:
+        logger.error(
+            "A picture render worker died; the next upload starts a new pool. "
+            "Run render_profile_variants to redo lost pictures."
+        )
+        _discard_pool(pool)
+    except Exception:
+        logger.exception("Rendering profile picture variants failed")
+    finally:
+        close_old_connections()
+
+
+def _worker_settings():
+    # Settings the workers need to find the same files as this process,
+    # even when they were changed after startup.
+    return {"MEDIA_ROOT": str(settings.MEDIA_ROOT), "STORAGES": settings.STORAGES}
+
+
+def _init_worker(settings_module, overrides):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking a threaded server process is unsafe.
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    os.environ.get("DJANGO_SETTINGS_MODULE", "Xstore.settings"),
+                    _worker_settings(),
+                ),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    """Stop the render processes (queued jobs are dropped)."""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        _discard_pool(pool)
+
+
+def schedule_variants(source_name, digest):
+    config = _config()
+    if not config["WORKERS"]:
+        render_now(source_name, digest)
+        return
+    pool = _get_pool(config["WORKERS"])
+    try:
+        future = pool.submit(render_variants, source_name, digest, config["SIZES"])
+    except BrokenProcessPool:
+        # Broken since the last job finished; start a fresh pool.
+        _discard_pool(pool)
+        pool = _get_pool(config["WORKERS"])
+        future = pool.submit(render_variants, source_name, digest, config["SIZES"])
+    future.add_done_callback(partial(_on_rendered, pool))
@@ -0,0 +1,67 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from shop.emails import EMAIL_INDEX_CONDITION
+
+OLD_LOOKUP = "SELECT 1 FROM auth_user WHERE email = ? LIMIT 1"
+NEW_LOOKUP = f"SELECT 1 FROM auth_user WHERE LOWER(email) = ? AND {EMAIL_INDEX_CONDITION} LIMIT 1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the signup email check on a scratch SQLite copy of auth_user: the old "
+        "unindexed `email = ?` scan against the LOWER(email) unique index probe "
+        "from shop.emails. Leaves the project database alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument("--lookups", type=int, default=200)
+
+    def handle(self, *args, **options):
+        users, lookups = options["users"], options["lookups"]
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(Path(tmp) / "bench.sqlite3")
+            conn.execute(
+                "CREATE TABLE auth_user (id INTEGER PRIMARY KEY, "
+                "username TEXT NOT NULL UNIQUE, email TEXT NOT NULL)"
+            )
+            started = time.perf_counter()
+            conn.executemany(
+                "INSERT INTO auth_user (username, email) VALUES (?, ?)",
+                ((f"user{i}", f"User{i}@Example.com" if i % 10 else "") for i in range(users)),
+            )
+            conn.commit()
+            self.stdout.write(f"{users} users loaded in {time.perf_counter() - started:.1f}s")
+
+            probes = [f"User{random.randrange(users)}@example.com" for _ in range(lookups)]
+            old = self.time_lookups(conn, OLD_LOOKUP, probes)
+
+            started = time.perf_counter()
+            conn.execute(
+                "CREATE UNIQUE INDEX user_email_lower_uniq ON auth_user ((LOWER(email))) "
+                "WHERE email <> ''"
+            )
+            self.stdout.write(f"index built in {time.perf_counter() - started:.1f}s")
+            new = self.time_lookups(conn, NEW_LOOKUP, [probe.lower() for probe in probes])
+            conn.close()
+
+        for label, timings in (("email = ? (scan)", old), ("LOWER(email) index", new)):
+            self.stdout.write(
+                f"{label:20} mean {statistics.mean(timings) * 1000:9.3f} ms  "
+                f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:9.3f} ms"
+            )
+
+    def time_lookups(self, conn, sql, probes):
+        timings = []
+        for probe in probes:
+            started = time.perf_counter()
+            conn.execute(sql, (probe,)).fetchone()
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)
@@ -0,0 +1,132 @@
+import asyncio
+import importlib
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+
+from shop.authentication import ClaimsRefreshToken
+from shop.models import Product
+from shop.throttling import TokenBucketThrottle
+
+URLCONFS = ["shop.urls", "reviews.urls", "Xstore.urls"]
+
+
+def reload_urlconfs():
+    # route() decides sync vs async when the URLconf is imported.
+    for name in URLCONFS:
+        importlib.reload(importlib.import_module(name))
+    clear_url_caches()
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync (WSGI) and async (ASGI) read paths for the catalog and "
+        "review endpoints under concurrent load, in process and against the "
+        "configured database. Reports requests/s and p50/p99 latency. Throttling "
+        "is disabled for the run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--username", help="Authenticate as this user (needed for the review listing)"
+        )
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by("id").first()
+        if product is None:
+            raise CommandError("No products to read; import some first.")
+
+        headers = {}
+        paths = [
+            "/shop/product_create?page=2",
+            f"/shop/product_detail/{product.id}",
+            "/shop/category_list",
+        ]
+        if options["username"]:
+            try:
+                user = User.objects.get(username=options["username"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['username']!r}")
+            headers["authorization"] = f"Bearer {ClaimsRefreshToken.for_user(user).access_token}"
+            paths.append(f"/reviews/products/{product.id}/reviews/")
+
+        requests = list(islice(cycle(paths), options["requests"]))
+        concurrency = options["concurrency"]
+        connection.close()
+
+        with (
+            mock.patch.object(TokenBucketThrottle, "allow_request", return_value=True),
+            override_settings(ALLOWED_HOSTS=["testserver"]),
+        ):
+            with override_settings(ASYNC_READ_VIEWS=False):
+                reload_urlconfs()
+                sync_stats = self.run_sync(requests, concurrency, headers)
+            with override_settings(ASYNC_READ_VIEWS=True):
+                reload_urlconfs()
+                async_stats = asyncio.run(self.run_async(requests, concurrency, headers))
+        reload_urlconfs()
+
+        self.stdout.write(
+            f"{len(requests)} requests, concurrency {concurrency}, paths: {', '.join(paths)}"
+        )
+        for label, stats in (("wsgi (sync views)", sync_stats), ("asgi (async views)", async_stats)):
+            self.stdout.write(
+                f"{label:20} {stats['rps']:8.0f} req/s  "
+                f"p50 {stats['p50']:7.1f} ms  p99 {stats['p99']:7.1f} ms"
+            )
+
+    def run_sync(self, requests, concurrency, headers):
+        """Threaded WSGI worker: one client per thread."""
+        local = threading.local()
+
+        def fetch(path):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            started = time.perf_counter()
+            response = local.client.get(path, headers=headers)
+            if response.status_code != 200:
+                raise CommandError(f"GET {path}: {response.status_code}")
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(fetch, requests))
+        return summarize(latencies, time.perf_counter() - started)
+
+    async def run_async(self, requests, concurrency, headers):
+        """One event loop with `concurrency` requests in flight."""
+        client = AsyncClient()
+        queue = iter(requests)
+        latencies = []
+
+        async def worker():
+            for path in queue:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                if response.status_code != 200:
+                    raise CommandError(f"GET {path}: {response.status_code}")
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started)
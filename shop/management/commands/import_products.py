@@ -0,0 +1,176 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shop.changes import categories_changed, products_changed
+from shop.models import Category, Product
+
+UPDATE_FIELDS = ["description", "price", "stock", "category"]
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV or JSONL file into the catalog. Rows are "
+        "upserted on the unique product name in batches; missing categories "
+        "are created on the fly. Every batch is recorded in the catalog change feed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with a header row) or JSONL file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format (default: from the file extension)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        fmt = options["format"] or ("csv" if path.suffix.lower() == ".csv" else "jsonl")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        # name -> id for every category; the table is small compared to products.
+        self.categories = dict(Category.objects.values_list("name", "id"))
+        imported = errors = 0
+        started = time.perf_counter()
+
+        with path.open(newline="", encoding="utf-8") as handle:
+            rows = self.read_rows(handle, fmt)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                products = {}
+                for line_no, raw in batch:
+                    try:
+                        product = self.build_product(raw)
+                    except RowError as exc:
+                        errors += 1
+                        self.stderr.write(f"line {line_no}: {exc}")
+                        continue
+                    # Last occurrence of a name in the batch wins.
+                    products[product.name] = product
+
+                self.write_batch(list(products.values()))
+                imported += len(products)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{imported} products imported, {errors} errors, "
+                    f"{imported / elapsed:.0f} rows/s"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {imported} products imported, {errors} rows rejected "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
+
+    def read_rows(self, handle, fmt):
+        """Yield (line number, dict) one row at a time."""
+        if fmt == "csv":
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else {"_invalid": line}
+
+    def build_product(self, raw):
+        if "_invalid" in raw:
+            raise RowError("not a JSON object")
+
+        name, category, description = (
+            raw.get(field) or "" for field in ("name", "category", "description")
+        )
+        if not all(isinstance(value, str) for value in (name, category, description)):
+            raise RowError("name, category and description must be strings")
+        name, category = name.strip(), category.strip().lower()
+        if not name:
+            raise RowError("name is required")
+        if not category:
+            raise RowError("category is required")
+        if len(name) > 255 or len(category) > 255:
+            raise RowError("name and category must be at most 255 characters")
+
+        try:
+            price = Decimal(str(raw.get("price")))
+            if not price.is_finite():
+                raise InvalidOperation
+            price = price.quantize(Decimal("0.01"))
+        except InvalidOperation:
+            raise RowError(f"invalid price {raw.get('price')!r}")
+        if price < Decimal("0.01") or price.adjusted() >= 8:
+            raise RowError(f"price out of range: {price}")
+
+        try:
+            stock = int(raw.get("stock") or 0)
+        except (TypeError, ValueError):
+            raise RowError(f"invalid stock {raw.get('stock')!r}")
+        if stock < 0:
+            raise RowError("stock cannot be negative")
+
+        product = Product(
+            name=name,
+            description=description,
+            price=price,
+            stock=stock,
+        )
+        product.category_name = category
+        return product
+
+    def resolve_categories(self, names):
+        missing = set(names) - self.categories.keys()
+        if not missing:
+            return
+        # Category.save() lowercases names; bulk_create skips save(), so the
+        # names are already lowercased in build_product.
+        Category.objects.bulk_create(
+            [Category(name=name) for name in missing], ignore_conflicts=True
+        )
+        created = dict(
+            Category.objects.filter(name__in=missing).values_list("name", "id")
+        )
+        self.categories.update(created)
+        categories_changed(created.values())
+
+    def write_batch(self, products):
+        if not products:
+            return
+        with transaction.atomic():
+            self.resolve_categories(product.category_name for product in products)
+            for product in products:
+                product.category_id = self.categories[product.category_name]
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=["name"],
+                update_fields=UPDATE_FIELDS,
+            )
+            # Not every backend returns ids for upserted rows, so look them up.
+            products_changed(
+                Product.objects.filter(
+                    name__in=[product.name for product in products]
+                ).values_list("id", flat=True)
+            )
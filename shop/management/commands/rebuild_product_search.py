@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+from shop.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from the product table."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError(
+                "The product FTS index is not available on this database. "
+                "Run migrations on SQLite first."
+            )
+        rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {Product.objects.count()} products.")
+        )
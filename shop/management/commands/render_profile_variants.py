@@ -0,0 +1,39 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from shop.images import content_hash, render_now
+from shop.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the missing variants of profile pictures: renders lost when a "
+        "worker died or the server stopped, and pictures stored before variants "
+        "existed (these are hashed first)."
+    )
+
+    def handle(self, *args, **options):
+        pending = (
+            UserProfile.objects.filter(picture_ready=False)
+            .exclude(profile_picture="")
+            .exclude(profile_picture__isnull=True)
+        )
+        sources = {}
+        for profile_id, name, digest in pending.values_list(
+            "id", "profile_picture", "picture_hash"
+        ).iterator():
+            if not default_storage.exists(name):
+                self.stderr.write(f"profile {profile_id}: {name} is missing")
+                continue
+            if not digest:
+                with default_storage.open(name) as file:
+                    digest = content_hash(file)
+                UserProfile.objects.filter(id=profile_id).update(picture_hash=digest)
+            sources.setdefault(digest, name)
+
+        for digest, name in sources.items():
+            try:
+                render_now(name, digest)
+            except Exception as exc:
+                self.stderr.write(f"{name}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {len(sources)} pictures."))
@@ -0,0 +1,173 @@
+"""
+Serving MEDIA_ROOT.
+
+django.views.static.serve (what `static()` wires up) is meant for
+development: it only answers If-Modified-Since and always sends the
+whole file. serve_media also answers If-None-Match from an ETag built
+from the file's mtime and size, sends single byte ranges as 206 Partial
+Content, and streams through FileResponse. FileResponse lets a WSGI
+server with `wsgi.file_wrapper` (gunicorn, uWSGI) send the file with
+sendfile() instead of copying it through Python.
+
+Behind nginx or Apache the transfer can be handed off entirely: the view
+resolves the path and answers conditional requests, then replies with
+only an X-Accel-Redirect or X-Sendfile header and the front end sends
+the file, ranges included.
+
+Configured by the MEDIA_SERVING setting:
+
+    MEDIA_SERVING = {
+        "BACKEND": "django",  # or "x-accel-redirect" / "x-sendfile"
+        "INTERNAL_PREFIX": "/protected-media/",  # nginx `internal` location
+        "MAX_AGE": 3600,  # Cache-Control max-age, seconds
+    }
+"""
+
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+DEFAULTS = {
+    "BACKEND": "django",
+    "INTERNAL_PREFIX": "/protected-media/",
+    "MAX_AGE": 3600,
+}
+
+BACKENDS = ("django", "x-accel-redirect", "x-sendfile")
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "MEDIA_SERVING", {})}
+
+
+class FileRange:
+    """Read at most `length` bytes of `file` from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, end inclusive. Returns None
+    when the header should be ignored (malformed or multiple ranges) and
+    raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if size == 0:  # no byte of an empty file can be addressed
+        raise ValueError
+    if not first:  # suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _range_applies(request, etag, mtime):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag  # strong comparison; weak tags never match
+    return parse_http_date_safe(if_range) == mtime
+
+
+def _handoff(config, path, fullpath):
+    response = HttpResponse(content_type=mimetypes.guess_type(fullpath.name)[0])
+    if config["BACKEND"] == "x-accel-redirect":
+        response["X-Accel-Redirect"] = config["INTERNAL_PREFIX"].rstrip("/") + "/" + quote(path)
+    else:
+        response["X-Sendfile"] = str(fullpath)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    config = _config()
+    if config["BACKEND"] not in BACKENDS:
+        raise ValueError(f"Unknown MEDIA_SERVING backend {config['BACKEND']!r}")
+
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+        stat = fullpath.stat()
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("File not found")
+    if not fullpath.is_file():
+        raise Http404("File not found")
+
+    mtime = int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Last-Modified": http_date(mtime)}
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        if config["BACKEND"] != "django":
+            response = _handoff(config, path, fullpath)
+        else:
+            response = _file_response(request, fullpath, stat.st_size, etag, mtime)
+    for name, value in headers.items():
+        response.headers.setdefault(name, value)
+    patch_cache_control(response, public=True, max_age=config["MAX_AGE"])
+    return response
+
+
+def _file_response(request, fullpath, size, etag, mtime):
+    byte_range = None
+    if "Range" in request.headers and _range_applies(request, etag, mtime):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = fullpath.open("rb")
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        if end == size - 1:
+            # Runs to the end of the file: keep the real file so the
+            # server's file_wrapper can still sendfile() it.
+            response = FileResponse(file, status=206)
+        else:
+            response = FileResponse(FileRange(file, end - start + 1), status=206)
+            response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,20 @@
+# auth_user belongs to django.contrib.auth, so its indexes can't be declared
+# on the model; they are created here instead.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_revokedtoken'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        # Backs the case-insensitive `?email=` prefix filter on the user listing.
+        migrations.RunSQL(
+            'CREATE INDEX user_email_lower_idx ON auth_user ((LOWER(email)))',
+            'DROP INDEX user_email_lower_idx',
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Refuse to add the unique index while accounts share an email (ignoring
+    case). Which account keeps it is for an operator to decide, so the
+    conflicts are listed instead of being resolved here.
+    """
+    User = apps.get_model("auth", "User")
+    duplicated = (
+        User.objects.exclude(email="")
+        .values(email_lower=Lower("email"))
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("email_lower", flat=True)
+    )
+    conflicts = (
+        User.objects.annotate(email_lower=Lower("email"))
+        .filter(email_lower__in=duplicated)
+        .order_by("email_lower", "id")
+        .values_list("email_lower", "id", "username")
+    )
+    lines = [f"  {email}: id={user_id} username={username}" for email, user_id, username in conflicts]
+    if lines:
+        raise RuntimeError(
+            "These accounts share an email address (ignoring case). Change or clear "
+            "all but one email of each group, then run migrate again:\n" + "\n".join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_user_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            'DROP INDEX user_email_lower_idx',
+            'CREATE INDEX user_email_lower_idx ON auth_user ((LOWER(email)))',
+        ),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX user_email_lower_uniq ON auth_user ((LOWER(email))) "
+            "WHERE email <> ''",
+            'DROP INDEX user_email_lower_uniq',
+        ),
+    ]
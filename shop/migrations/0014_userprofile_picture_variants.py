@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_user_email_lower_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
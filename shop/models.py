@@ -5,11 +5,32 @@ from django.core.validators import MinValueValidator
 # Create your models here.
 
 
+class ClaimsUser(User):
+    """
+    A User built from access-token claims by shop.authentication.
+
+    Only the fields carried in the token are set. The first access to any
+    other field loads all of the remaining ones in a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     phone = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to="user_image", null=True, blank=True)
+    # SHA-256 of the picture; names the stored file and its variants (shop.images).
+    picture_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    picture_ready = models.BooleanField(default=False)  # variants generated
 
     def __str__(self):
         return self.user.username
@@ -40,6 +61,13 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination orderings (see shop.pagination).
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -75,6 +103,14 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Pending")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Per-user order history, paged on (created_at, id).
+            models.Index(
+                fields=["user", "created_at", "id"], name="order_user_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -87,3 +123,31 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only log of product and category writes, read by the delta-sync
+    feed. The auto-increment id is the feed position.
+    """
+
+    PRODUCT = "product"
+    CATEGORY = "category"
+    ENTITY_CHOICES = ((PRODUCT, "Product"), (CATEGORY, "Category"))
+
+    entity = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "changed"
+        return f"{self.entity} {self.object_id} {action}"
+
+
+class RevokedToken(models.Model):
+    """A revoked refresh token, kept until it would have expired anyway."""
+
+    jti = models.UUIDField(primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,131 @@
+"""
+Order placement and item rewrites.
+
+`place_order` is shared by OrderSerializer.create and the cart checkout,
+`rewrite_order_items` backs OrderSerializer.update and `cancel_orders`
+cancels in bulk. Each runs a fixed number of statements whatever the
+number of lines or orders: stock moves are one conditional
+UPDATE and item writes are bulk INSERT / UPDATE / DELETE statements.
+"""
+
+from django.db import transaction
+
+from .changes import products_changed
+from .models import Cart, Order, OrderItem
+from .stock import adjust_stock, aggregate_quantities, reserve_stock, restock_orders
+
+
+CANCELLABLE_STATUSES = ("Pending", "Processing")
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def place_order(lines, **order_fields):
+    """
+    Create an order for `lines` ([(product, quantity), ...]) and take the
+    stock for it. Raises shop.stock.InsufficientStock if any line is short.
+    Must run inside a transaction so a failure leaves nothing behind.
+    """
+    reserve_stock(aggregate_quantities((product.id, qty) for product, qty in lines))
+
+    items = [
+        OrderItem(product=product, quantity=qty, price=product.price * qty)
+        for product, qty in lines
+    ]
+    order = Order.objects.create(
+        total_price=sum(item.price for item in items), **order_fields
+    )
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+
+    products_changed(product.id for product, _ in lines)
+    return order
+
+
+def checkout_cart(user):
+    """Turn the user's whole cart into an order and empty the cart."""
+    with transaction.atomic():
+        cart = list(
+            Cart.objects.select_for_update(of=("self",))
+            .select_related("product")
+            .filter(user=user)
+        )
+        if not cart:
+            raise EmptyCart()
+
+        order = place_order([(line.product, line.quantity) for line in cart], user=user)
+        # Only the rows we read: lines added concurrently stay in the cart.
+        Cart.objects.filter(id__in=[line.id for line in cart]).delete()
+    return order
+
+
+def rewrite_order_items(order, lines):
+    """
+    Make `order`'s items match `lines` ([(product, quantity), ...]) and
+    return the new order total.
+
+    One pass over the existing items works out adds, changes and removals.
+    Stock moves by the quantity delta per product only. Raises
+    shop.stock.InsufficientStock if an increase can't be covered.
+    """
+    wanted = {}
+    for product, qty in lines:
+        previous = wanted.get(product.id, (product, 0))[1]
+        wanted[product.id] = (product, previous + qty)
+
+    existing = {item.product_id: item for item in order.items.all()}
+    changes = {}
+    to_create = []
+    to_update = []
+    total = 0
+
+    for product_id, (product, qty) in wanted.items():
+        price = product.price * qty
+        total += price
+        item = existing.pop(product_id, None)
+        if item is None:
+            to_create.append(
+                OrderItem(order=order, product=product, quantity=qty, price=price)
+            )
+            changes[product_id] = -qty
+        elif item.quantity != qty or item.price != price:
+            changes[product_id] = item.quantity - qty
+            item.quantity = qty
+            item.price = price
+            to_update.append(item)
+
+    # Whatever is left in `existing` was dropped from the order.
+    for product_id, item in existing.items():
+        changes[product_id] = item.quantity
+
+    adjust_stock(changes)
+    if to_create:
+        OrderItem.objects.bulk_create(to_create)
+    if to_update:
+        OrderItem.objects.bulk_update(to_update, ["quantity", "price"])
+    if existing:
+        OrderItem.objects.filter(order=order, product_id__in=list(existing)).delete()
+
+    getattr(order, "_prefetched_objects_cache", {}).pop("items", None)
+    products_changed(changes)
+    return total
+
+
+def cancel_orders(order_ids):
+    """
+    Cancel every still-cancellable order in `order_ids` and put its stock
+    back. Returns the ids that were actually cancelled.
+    """
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, status__in=CANCELLABLE_STATUSES)
+            .values_list("id", flat=True)
+        )
+        if ids:
+            products_changed(restock_orders(ids))
+            Order.objects.filter(id__in=ids).update(status="Cancelled")
+    return ids
@@ -0,0 +1,191 @@
+import base64
+import json
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite (value, id) ordering.
+
+    Each page is fetched with a `WHERE (value, id) > (last_value, last_id)`
+    style filter instead of an OFFSET, and no COUNT query is issued, so the
+    cost of a page does not depend on how deep into the listing it is.
+    """
+
+    page_size = 5
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+
+    # Public ordering name -> order_by() fields. The last field must be unique.
+    orderings = {
+        "-created_at": ("-created_at", "-id"),
+        "created_at": ("created_at", "id"),
+    }
+    default_ordering = "-created_at"
+
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Same as paginate_queryset, fetching the page with the async ORM."""
+        return self.finish_page(
+            [row async for row in self.page_queryset(queryset, request)]
+        )
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(self.ordering, position))
+
+        # Fetch one extra row to find out whether there is a next page.
+        return queryset[: self.page_size + 1]
+
+    def finish_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+
+        self.next_position = None
+        if self.has_next:
+            self.next_position = [
+                getattr(rows[-1], field.lstrip("-")) for field in self.ordering
+            ]
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request):
+        key = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        return self.orderings.get(key, self.orderings[self.default_ordering])
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        """Build the lexicographic "comes after `position`" condition."""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            clause = Q(**{f"{name}__{lookup}": position[index]})
+            for previous, value in zip(ordering[:index], position[:index]):
+                clause &= Q(**{previous.lstrip("-"): value})
+            condition |= clause
+        return condition
+
+    def encode_cursor(self, position):
+        raw = json.dumps([str(value) for value in position]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_first_link(self):
+        return remove_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "first": self.get_first_link(),
+                "results": data,
+            }
+        )
+
+
+class ProductCursorPagination(KeysetPagination):
+    orderings = {
+        "-created_at": ("-created_at", "-id"),
+        "created_at": ("created_at", "id"),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+    }
+
+
+class OrderCursorPagination(KeysetPagination):
+    page_size = 20
+
+
+class UserCursorPagination(KeysetPagination):
+    page_size = 50
+    orderings = {
+        "id": ("id",),
+        "-id": ("-id",),
+        "username": ("username",),
+    }
+    default_ordering = "id"
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination with an `apaginate_queryset` for async views.
+
+    Django's Paginator only counts and slices synchronously, so the count
+    and the page are fetched here with acount() and async iteration and
+    handed to the paginator, which does the page-number arithmetic.
+    """
+
+    page_size = 5
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        paginator.count = await queryset.acount()
+
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(
+                paginator.num_pages if page_number in self.last_page_strings else page_number
+            )
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            )
+
+        bottom = (number - 1) * paginator.per_page
+        rows = [row async for row in queryset[bottom : bottom + paginator.per_page]]
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return rows
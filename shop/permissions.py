@@ -8,3 +8,9 @@ class IsAdminOrReadOnly(BasePermission):
         if request.method in ["GET"]:
             return True  # Allow GET requests for all users
         return request.user.is_staff  # Allow only admin users to modify
+
+class IsAdminOrSignup(BasePermission):
+    def has_permission(self, request, view):
+        if request.method == "POST":
+            return True  # Anyone can sign up
+        return request.user.is_staff  # Only admins can list users
@@ -0,0 +1,87 @@
+"""
+Full-text product search backed by an SQLite FTS5 index.
+
+`shop_product_fts` is an external-content FTS5 table over Product.name and
+Product.description. Triggers created by migration 0007_product_fts keep it
+in sync on every INSERT, UPDATE OF name/description and DELETE, so bulk
+writes are covered too. On other database backends (or SQLite builds without FTS5)
+searches fall back to the old `icontains` scan.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "shop_product_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_available(using=None):
+    """True when the product FTS index exists on the given connection."""
+    conn = using or connection
+    if conn.vendor != "sqlite":
+        return False
+    # Checked once per connection object; the schema doesn't change at runtime.
+    available = getattr(conn, "_shop_fts_available", None)
+    if available is None:
+        available = FTS_TABLE in conn.introspection.table_names()
+        conn._shop_fts_available = available
+    return available
+
+
+def build_match_query(query, column=None):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so user input can never be
+    parsed as FTS5 syntax and "lap" still finds "laptop". Returns an empty
+    string when the query has no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    prefix = f"{column} : " if column else ""
+    return " AND ".join(f'{prefix}"{token}"*' for token in tokens)
+
+
+def search_products(queryset, query, column=None, ranked=True):
+    """
+    Restrict a Product queryset to rows matching `query`.
+
+    With `ranked=True` the result is joined against the index and ordered
+    by bm25 relevance (best first), exposed as `search_rank`. Otherwise the
+    index is only used as an `id IN (...)` filter and ordering is left alone.
+    """
+    match = build_match_query(query, column)
+    if not match:
+        return queryset.none()
+
+    if not fts_available():
+        if column:
+            return queryset.filter(**{f"{column}__icontains": query})
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        )
+
+    if not ranked:
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+            )
+        )
+
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = shop_product.id", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+        select={"search_rank": f"{FTS_TABLE}.rank"},
+        order_by=["search_rank"],
+    )
+
+
+def rebuild_index():
+    """Repopulate the whole index from shop_product."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
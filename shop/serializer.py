@@ -1,22 +1,49 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.timezone import now
 from datetime import timedelta
-from django.db import transaction
+from functools import reduce
+from operator import or_
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 
 
+from reviews.summary import format_summary, summary_for
+
+from .changes import products_changed
+from .emails import email_taken
+from .images import attach_picture, variant_urls
 from .models import UserProfile, Category, Product, Cart, Order, OrderItem
+from .orders import place_order, rewrite_order_items
+from .stock import InsufficientStock, restock_orders
+
+
+EMAIL_TAKEN = "A user with this email already exists."
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
 
     profile_picture = serializers.ImageField(required=False, allow_null=True)
+    profile_picture_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
-        fields = ["phone", "address", "profile_picture"]
+        fields = ["phone", "address", "profile_picture", "profile_picture_variants"]
         read_only_fields = ["id", "created_at"]
 
+    def get_profile_picture_variants(self, profile):
+        """Resized WebP/JPEG URLs by size, or None until they are rendered."""
+        if not profile.picture_ready:
+            return None
+        request = self.context.get("request")
+        urls = variant_urls(profile.picture_hash)
+        if request is not None:
+            for formats in urls.values():
+                for ext, url in formats.items():
+                    formats[ext] = request.build_absolute_uri(url)
+        return urls
+
 
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer(required=True)
@@ -27,28 +54,49 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "password", "profile"]
         read_only_fields = ["id", "created_at"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # `context["fields"]` restricts the output to those fields (see user_list_create).
+        only = self.context.get("fields")
+        if only is not None:
+            for name in set(self.fields) - set(only):
+                self.fields.pop(name)
+
     def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with this email already exists.")
+        # An index probe on LOWER(email); see shop.emails.
+        if value and email_taken(value, exclude_user=self.instance):
+            raise serializers.ValidationError(EMAIL_TAKEN)
         return value
 
+    def save_user(self, user):
+        """
+        Save `user`, turning a lost race on the email index into the same
+        validation error validate_email gives.
+        """
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            if user.email and email_taken(user.email, exclude_user=user):
+                raise serializers.ValidationError({"email": [EMAIL_TAKEN]})
+            raise
+
     def create(self, validated_data):
         """Custom user creation with profile and image handling"""
         profile_data = validated_data.pop("profile")
         profile_picture = profile_data.pop("profile_picture", None)
         password = validated_data.pop("password")
 
-        user = User.objects.create_user(
-            username=validated_data["username"],
-            email=validated_data.get("email", ""),
+        user = User(
+            username=User.normalize_username(validated_data["username"]),
+            email=User.objects.normalize_email(validated_data.get("email", "")),
             # password=validated_data["password"],
         )
         user.set_password(password)
-        user.save()
+        self.save_user(user)
         profile = UserProfile.objects.create(user=user, **profile_data)
         if profile_picture:
-            profile.profile_picture = profile_picture
-            profile.save()
+            attach_picture(profile, profile_picture)
 
         return user
 
@@ -60,17 +108,22 @@ class UserSerializer(serializers.ModelSerializer):
         instance.email = validated_data.get("email", instance.email)
         if "password" in validated_data:
             instance.set_password(validated_data["password"])
-        instance.save()
+        self.save_user(instance)
 
         if profile_data:
             profile = instance.profile
             profile.phone = profile_data.get("phone", profile.phone)
             profile.address = profile_data.get("address", profile.address)
 
-            if "profile_picture" in profile_data:
-                profile.profile_picture = profile_data["profile_picture"]
-
-            profile.save()
+            picture = profile_data.get("profile_picture")
+            if picture:
+                attach_picture(profile, picture)
+            else:
+                if "profile_picture" in profile_data:  # explicit null clears it
+                    profile.profile_picture = None
+                    profile.picture_hash = ""
+                    profile.picture_ready = False
+                profile.save()
 
         return instance
 
@@ -91,6 +144,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     # category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     category = CategorySerializer()
+    rating = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -101,18 +155,27 @@ class ProductSerializer(serializers.ModelSerializer):
             "price",
             "stock",
             "category",
+            "rating",
             "created_at",
         ]
         read_only_fields = ["id", "created_at"]
 
+    def get_rating(self, obj):
+        # Listings annotate the summary (see with_rating_summary); single
+        # instances coming from writes fall back to one lookup.
+        if hasattr(obj, "rating_summary"):
+            return format_summary(obj.rating_summary)
+        return format_summary(summary_for(obj))
+
     def create(self, validated_data):
         category_data = validated_data.pop("category")
 
-        category= Category.objects.get_or_create(
+        category, created = Category.objects.get_or_create(
             name=category_data["name"].lower()
         )
 
         product = Product.objects.create(category=category, **validated_data)
+        products_changed([product.id])
         return product
 
     def update(self, instance, validated_data):
@@ -130,26 +193,110 @@ class ProductSerializer(serializers.ModelSerializer):
             
             
         instance.save()
+        products_changed([instance.id])
         return instance
 
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that, inside a BulkResolveListSerializer, takes
+    the instance from the list's preloaded map instead of querying per item.
+    """
+
+    def to_internal_value(self, data):
+        parent_list = getattr(self.parent, "parent", None)
+        preloaded = getattr(parent_list, "preloaded", {}).get(self.field_name)
+        if preloaded is None:
+            return super().to_internal_value(data)
+
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in preloaded:
+            self.fail("does_not_exist", pk_value=data)
+        return preloaded[pk]
+
+
+class BulkResolveListSerializer(serializers.ListSerializer):
+    """
+    Resolves every BulkPrimaryKeyRelatedField of the child with one
+    `id__in` query for the whole payload, so validating N items costs a
+    fixed number of queries.
+    """
+
+    def to_internal_value(self, data):
+        self.preloaded = {}
+        if isinstance(data, list):
+            for field in self.child.fields.values():
+                if isinstance(field, BulkPrimaryKeyRelatedField) and not field.read_only:
+                    self.preloaded[field.field_name] = self._load(field, data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def _load(field, data):
+        queryset = field.get_queryset()
+        pks = set()
+        for item in data:
+            if not isinstance(item, dict) or field.field_name not in item:
+                continue
+            try:
+                pks.add(queryset.model._meta.pk.to_python(item[field.field_name]))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue  # reported by the field itself
+        return queryset.in_bulk(pks) if pks else {}
+
+
+class CartListSerializer(BulkResolveListSerializer):
+    """
+    Batch cart sync: each (product, quantity) sets that line's quantity,
+    written with one upsert on unique_user_product_cart. Quantity 0 removes
+    the line. If a product appears twice, the last entry wins.
+    """
+
+    def create(self, validated_data):
+        lines = {}
+        for attrs in validated_data:
+            lines[(attrs["user"].pk, attrs["product"].pk)] = attrs
+
+        keep = [Cart(**attrs) for attrs in lines.values() if attrs["quantity"]]
+        drop = [key for key, attrs in lines.items() if not attrs["quantity"]]
+
+        with transaction.atomic():
+            if keep:
+                Cart.objects.bulk_create(
+                    keep,
+                    update_conflicts=True,
+                    unique_fields=["user", "product"],
+                    update_fields=["quantity"],
+                )
+            if drop:
+                Cart.objects.filter(
+                    reduce(or_, (Q(user_id=u, product_id=p) for u, p in drop))
+                ).delete()
+        return keep
+
+
 class CartSerializer(serializers.ModelSerializer):
     # user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
     # user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = BulkPrimaryKeyRelatedField(queryset=Product.objects.all())
 
     class Meta:
         model = Cart
         fields = ["id", "product", "quantity", "added_at", "user"]
         read_only_fields = ["id", "added_at", "user"]
+        list_serializer_class = CartListSerializer
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    product = BulkPrimaryKeyRelatedField(queryset=Product.objects.all())
     price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = OrderItem
         fields = ["product", "quantity", "price"]
+        list_serializer_class = BulkResolveListSerializer
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -191,29 +338,13 @@ class OrderSerializer(serializers.ModelSerializer):
         #     )
 
         with transaction.atomic():
-            order = Order.objects.create(total_price=0, **validated_data)
-            total_price = 0
-
-            for item_data in items_data:
-                product = item_data["product"]
-                quantity = item_data["quantity"]
-
-                if product.stock < quantity:
-                    raise serializers.ValidationError(
-                        f"Not enough stock for {product.name}."
-                    )
-
-                product.stock -= quantity
-                product.save()
-
-                price = product.price * quantity  # Add this
-                order_item = OrderItem.objects.create(
-                    order=order, product=product, quantity=quantity, price=price
+            try:
+                order = place_order(
+                    [(item["product"], item["quantity"]) for item in items_data],
+                    **validated_data,
                 )
-                total_price += order_item.price * order_item.quantity
-
-            order.total_price = total_price
-            order.save()
+            except InsufficientStock as exc:
+                raise serializers.ValidationError(str(exc))
 
         return order
 
@@ -233,49 +364,22 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 " Order cannot be updated after it has been shipped or delivered."
             )
+        # A cancelled order's stock has already been put back.
+        if instance.status == "Cancelled":
+            raise serializers.ValidationError("Order cannot be updated after it has been cancelled.")
 
         with transaction.atomic():
             if items_data is not None:
-                existing_items = {
-                    item.product.id: item for item in instance.items.all()
-                }
-                total_price = 0
-
-                for item_data in items_data:
-                    product = item_data["product"]
-                    quantity = item_data["quantity"]
-
-                    if product.stock < quantity:
-                        raise serializers.ValidationError(
-                            f" Not enough stock for {product.name}."
-                        )
-                    product.stock -= quantity
-
-                    if product.id in existing_items:
-                        order_item = existing_items[product.id]
-                        order_item.quantity = quantity
-                        order_item.price = product.price * quantity
-                        order_item.save()
-                    else:
-                        order_item = OrderItem.objects.create(
-                            order=instance,
-                            product=product,
-                            quantity=quantity,
-                            price=product.price * quantity,
-                        )
-
-                    total_price += order_item.price
-
-                for product_id in list(existing_items.keys()):
-                    if product_id not in [item["product"].id for item in items_data]:
-                        existing_items[product_id].delete()
-
-                instance.total_price = total_price
+                try:
+                    instance.total_price = rewrite_order_items(
+                        instance,
+                        [(item["product"], item["quantity"]) for item in items_data],
+                    )
+                except InsufficientStock as exc:
+                    raise serializers.ValidationError(str(exc))
 
             if new_status == "Cancelled" and instance.status != "Cancelled":
-                for item in instance.items.all():
-                    item.product.stock += item.quantity
-                    item.product.save()
+                products_changed(restock_orders([instance.id]))
 
             instance.status = new_status
             instance.save()
@@ -0,0 +1,112 @@
+"""
+Set-based stock changes.
+
+Stock is never read into Python and written back. Reservations are a
+single conditional UPDATE, so two concurrent checkouts can't both take the
+last unit (no lost update), and the cost is one statement however many
+lines the order has.
+"""
+
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, When
+
+from .models import OrderItem, Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        self.products = products  # names of the products that ran short
+        super().__init__(f"Not enough stock for {', '.join(products)}.")
+
+
+def aggregate_quantities(lines):
+    """Sum (product_id, quantity) pairs into {product_id: quantity}."""
+    totals = Counter()
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    return dict(totals)
+
+
+def _stock_delta(changes):
+    return Case(
+        *[
+            When(id=product_id, then=F("stock") + change)
+            for product_id, change in changes.items()
+        ],
+        default=F("stock"),
+        output_field=IntegerField(),
+    )
+
+
+def adjust_stock(changes):
+    """
+    Apply `changes` ({product_id: +n or -n}) in one statement, all or nothing.
+
+    Runs `UPDATE ... SET stock = CASE id WHEN .. THEN stock + change .. END
+    WHERE (id = .. AND stock >= n) OR (id = ..) ...`, where only takes
+    (negative changes) carry a stock condition. If fewer rows than products
+    match, the savepoint is rolled back and InsufficientStock is raised.
+    """
+    changes = {pid: change for pid, change in changes.items() if change}
+    if not changes:
+        return
+
+    condition = reduce(
+        or_,
+        (
+            Q(id=pid, stock__gte=-change) if change < 0 else Q(id=pid)
+            for pid, change in changes.items()
+        ),
+    )
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(condition).update(
+                stock=_stock_delta(changes)
+            )
+            if updated != len(changes):
+                raise InsufficientStock([])
+    except InsufficientStock:
+        # Slow path only: work out which products were short for the message.
+        rows = {
+            pid: (name, stock)
+            for pid, name, stock in Product.objects.filter(
+                id__in=changes
+            ).values_list("id", "name", "stock")
+        }
+        short = [
+            rows.get(pid, (str(pid), 0))[0]
+            for pid, change in changes.items()
+            if rows.get(pid, (None, 0))[1] < -change
+        ]
+        raise InsufficientStock(short)
+
+
+def reserve_stock(quantities):
+    """Take `quantities` ({product_id: n}) out of stock, all or nothing."""
+    adjust_stock({pid: -qty for pid, qty in quantities.items()})
+
+
+def release_stock(quantities):
+    """Put `quantities` ({product_id: n}) back into stock in one UPDATE."""
+    adjust_stock(quantities)
+
+
+def restock_orders(order_ids):
+    """
+    Return the stock held by the given orders and the {product_id: n} moved.
+
+    Quantities are summed per product in the database and written back with
+    one CASE/WHEN UPDATE, so no product rows are loaded into Python.
+    """
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values("product_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_id", "total")
+    )
+    release_stock(quantities)
+    return quantities
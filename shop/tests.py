@@ -1,10 +1,73 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.test import APIClient, force_authenticate
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, images, views
+from .authentication import ClaimsJWTAuthentication, ClaimsRefreshToken
+from .blacklist import revocations
+from .cache import LRUCache, catalog_version
+from .changes import products_changed
+from .checks import check_product_cache_is_shared
+from .images import variant_name
+from .models import Cart, Category, Order, OrderItem, Product, RevokedToken, UserProfile
+from .orders import place_order
+from .serializer import OrderSerializer, UserSerializer
+from .stock import restock_orders
+from .throttling import BucketStore, buckets
+
+logger = logging.getLogger(__name__)
+
+
+def isolate_stores(testcase):
+    """
+    Give `testcase` its own cache files and throttle buckets instead of the
+    host-wide ones a dev server on this machine is using.
+    """
+    tmp = tempfile.TemporaryDirectory()
+    testcase.addCleanup(tmp.cleanup)
+    overrides = override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": str(Path(tmp.name) / "cache"),
+            }
+        },
+        THROTTLE_STORE={**settings.THROTTLE_STORE, "PATH": Path(tmp.name) / "throttle.sqlite3"},
+    )
+    overrides.enable()
+    testcase.addCleanup(overrides.disable)
+
 
 class UserTests(TestCase):
     def setUp(self):
+        isolate_stores(self)
         self.client = APIClient()
 
     def test_create_user(self):
@@ -46,3 +109,1197 @@ class UserTests(TestCase):
         response = self.client.post("/product_create", product_data, format="json")
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.data["data"]["name"], "Laptop")
+
+
+class ProductCursorPaginationTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        category = Category.objects.create(name="books")
+        for i in range(12):
+            Product.objects.create(
+                name=f"Book {i}",
+                description="A book",
+                price=10 + (i % 3),
+                stock=5,
+                category=category,
+            )
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            names += [product["name"] for product in response.data["results"]]
+            url = response.data["next"]
+        return names
+
+    def test_cursor_pages_cover_listing_once(self):
+        names = self.walk("/shop/product_create?pagination=cursor&page_size=5")
+        self.assertEqual(len(names), 12)
+        self.assertEqual(len(set(names)), 12)
+
+    def test_cursor_price_ordering_with_filters(self):
+        names = self.walk(
+            "/shop/product_create?pagination=cursor&ordering=price&page_size=2&min_price=11"
+        )
+        prices = [Product.objects.get(name=name).price for name in names]
+        self.assertEqual(len(names), 8)
+        self.assertEqual(prices, sorted(prices))
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        category = Category.objects.create(name="electronics")
+        self.laptop = Product.objects.create(
+            name="Gaming Laptop", description="Fast machine", price=900, category=category
+        )
+        Product.objects.create(
+            name="Office Chair", description="Laptop friendly desk seat", price=90, category=category
+        )
+
+    def search(self, query):
+        response = self.client.get(f"/shop/product_create?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.data["results"]]
+
+    def test_search_matches_name_and_description_ranked(self):
+        self.assertEqual(self.search("search=laptop"), ["Gaming Laptop", "Office Chair"])
+        self.assertEqual(self.search("name=lap"), ["Gaming Laptop"])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.laptop.name = "Gaming Notebook"
+        self.laptop.save()
+        self.assertEqual(self.search("name=notebook"), ["Gaming Notebook"])
+        self.assertEqual(self.search("name=laptop"), [])
+
+        self.laptop.delete()
+        self.assertEqual(self.search("search=gaming"), [])
+
+    def test_invalid_filter_is_a_400(self):
+        response = self.client.get("/shop/product_create?min_price=abc")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("min_price", response.data)
+
+    def test_rebuild_command(self):
+        call_command("rebuild_product_search", stdout=StringIO())
+        self.assertEqual(self.search("search=chair"), ["Office Chair"])
+
+
+class ProductDetailCacheTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        category = Category.objects.create(name="garden")
+        self.product = Product.objects.create(
+            name="Hose", description="Green hose", price=20, stock=3, category=category
+        )
+        self.url = f"/shop/product_detail/{self.product.id}"
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["name"], "Hose")
+
+    def test_update_and_delete_invalidate(self):
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        self.client.get(self.url)
+
+        self.client.put(self.url, {"price": "25.00"}, format="json")
+        self.assertEqual(self.client.get(self.url).data["price"], "25.00")
+
+        self.client.delete(self.url)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_lru_evicts_and_counts(self):
+        lru = LRUCache(max_size=2, timeout=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual((lru.hits, lru.misses, lru.evictions), (2, 1, 1))
+
+    def test_per_process_cache_is_flagged(self):
+        self.assertEqual(check_product_cache_is_shared(None), [])
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        for overrides in ({"PRODUCT_CACHE": {"BACKEND": "local"}}, {"CACHES": locmem}):
+            with self.settings(**overrides):
+                warnings = check_product_cache_is_shared(None)
+            self.assertEqual([warning.id for warning in warnings], ["shop.W001"])
+
+
+class ProductListingCacheTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.category = Category.objects.create(name="toys")
+        Product.objects.create(
+            name="Kite", description="Red kite", price=15, stock=2, category=self.category
+        )
+
+    def test_equivalent_queries_share_an_entry(self):
+        self.client.get("/shop/product_create?category=toys&min_price=10")
+        with self.assertNumQueries(0):
+            response = self.client.get("/shop/product_create?min_price=10.00&category=TOYS")
+        self.assertEqual(response.data["count"], 1)
+
+    def test_writes_bump_the_catalog_version(self):
+        self.client.get("/shop/product_create")
+        version = catalog_version()
+
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        kite = Product.objects.get(name="Kite")
+        self.client.put(f"/shop/product_detail/{kite.id}", {"price": "12.00"}, format="json")
+        self.client.force_authenticate(user=None)
+
+        self.assertNotEqual(catalog_version(), version)
+        response = self.client.get("/shop/product_create")
+        self.assertEqual(response.data["results"][0]["price"], "12.00")
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="x")
+        category = Category.objects.create(name="kitchen")
+        self.pan = Product.objects.create(
+            name="Pan", description="Cast iron", price=30, stock=5, category=category
+        )
+        self.pot = Product.objects.create(
+            name="Pot", description="Steel", price=20, stock=1, category=category
+        )
+
+    def checkout(self, *lines):
+        serializer = OrderSerializer(
+            data={"items": [{"product": p.id, "quantity": q} for p, q in lines]}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save(user=self.user)
+
+    def test_order_reserves_stock_and_totals_lines(self):
+        order = self.checkout((self.pan, 2), (self.pot, 1))
+        self.pan.refresh_from_db()
+        self.pot.refresh_from_db()
+        self.assertEqual((self.pan.stock, self.pot.stock), (3, 0))
+        self.assertEqual(order.total_price, 80)
+        self.assertEqual(order.items.count(), 2)
+
+    def test_short_line_rolls_back_whole_order(self):
+        with self.assertRaisesMessage(ValidationError, "Not enough stock for Pot."):
+            self.checkout((self.pan, 2), (self.pot, 2))
+        self.pan.refresh_from_db()
+        self.assertEqual(self.pan.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+
+class StockContentionTests(TransactionTestCase):
+    threads = 8
+    attempts_per_thread = 5
+    lock_retries = 50
+
+    def test_concurrent_checkouts_never_oversell(self):
+        category = Category.objects.create(name="tickets")
+        product = Product.objects.create(
+            name="Ticket", description="Seat", price=10, stock=12, category=category
+        )
+        users = [
+            User.objects.create_user(username=f"fan{i}", password="x")
+            for i in range(self.threads)
+        ]
+        sold = []
+        refused = []
+        locked_out = []
+        barrier = threading.Barrier(self.threads)
+
+        def buy(user):
+            barrier.wait()
+            try:
+                for _ in range(self.attempts_per_thread):
+                    for retry in range(self.lock_retries):
+                        serializer = OrderSerializer(
+                            data={"items": [{"product": product.id, "quantity": 1}]}
+                        )
+                        try:
+                            serializer.is_valid(raise_exception=True)
+                            serializer.save(user=user)
+                            sold.append(1)
+                            break
+                        except ValidationError:
+                            refused.append(1)
+                            break
+                        except OperationalError:
+                            # SQLite table lock under contention: back off, retry
+                            time.sleep(0.001 * min(retry + 1, 20))
+                    else:
+                        locked_out.append(user.username)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        # self.fail() in a worker thread wouldn't fail the test, so report here.
+        if locked_out:
+            self.fail(f"Still locked after {self.lock_retries} retries: {locked_out}")
+        product.refresh_from_db()
+        self.assertEqual(len(sold), 12)
+        self.assertEqual(len(refused), self.threads * self.attempts_per_thread - 12)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 12)
+        logger.info(
+            "checkout throughput: %.1f orders/s over %d attempts",
+            (len(sold) + len(refused)) / elapsed,
+            len(sold) + len(refused),
+        )
+
+
+class BulkProductResolutionTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="stationery")
+        self.products = [
+            Product.objects.create(
+                name=f"Pen {i}", description="Blue ink", price=2, stock=50, category=category
+            )
+            for i in range(10)
+        ]
+
+    def test_order_items_resolve_with_one_query(self):
+        data = {"items": [{"product": p.id, "quantity": 1} for p in self.products]}
+        serializer = OrderSerializer(data=data)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(
+            [item["product"] for item in serializer.validated_data["items"]], self.products
+        )
+
+    def test_unknown_and_malformed_ids_are_reported_per_item(self):
+        data = {"items": [{"product": 999999, "quantity": 1}, {"product": "x", "quantity": 1}]}
+        serializer = OrderSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        errors = serializer.errors["items"]
+        self.assertEqual(errors[0]["product"][0].code, "does_not_exist")
+        self.assertEqual(errors[1]["product"][0].code, "incorrect_type")
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="shopper", password="x")
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="pantry")
+
+    def fill_cart(self, lines):
+        products = []
+        for i in range(lines):
+            product = Product.objects.create(
+                name=f"Jar {lines}-{i}", description="Jam", price=4, stock=3, category=self.category
+            )
+            Cart.objects.create(user=self.user, product=product, quantity=2)
+            products.append(product)
+        return products
+
+    def checkout_queries(self, lines):
+        self.fill_cart(lines)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/shop/checkout")
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(queries)
+
+    def test_checkout_converts_cart_to_order(self):
+        products = self.fill_cart(2)
+        response = self.client.post("/shop/checkout")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["data"]["total_price"], "16.00")
+        self.assertEqual(len(response.data["data"]["items"]), 2)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 1)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        self.assertEqual(self.checkout_queries(2), self.checkout_queries(12))
+
+    def test_short_stock_keeps_cart(self):
+        product = self.fill_cart(1)[0]
+        Cart.objects.filter(user=self.user).update(quantity=5)
+        response = self.client.post("/shop/checkout")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], f"Not enough stock for {product.name}.")
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        self.assertEqual(self.client.post("/shop/checkout").status_code, 400)
+
+
+class CartBulkUpsertTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="syncer", password="x")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="snacks")
+        self.products = [
+            Product.objects.create(
+                name=f"Chips {i}", description="Salty", price=1, stock=10, category=category
+            )
+            for i in range(3)
+        ]
+
+    def test_upsert_sets_quantities_and_removes_zero_lines(self):
+        a, b, c = self.products
+        Cart.objects.create(user=self.user, product=a, quantity=1)
+        Cart.objects.create(user=self.user, product=c, quantity=4)
+
+        payload = [
+            {"product": a.id, "quantity": 3},
+            {"product": b.id, "quantity": 2},
+            {"product": c.id, "quantity": 0},
+        ]
+        # products, upsert, delete, cart read (+ savepoint and release)
+        with self.assertNumQueries(6):
+            response = self.client.post("/shop/cart_bulk_upsert", payload, format="json")
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            sorted((line["product"], line["quantity"]) for line in response.data["data"]),
+            [(a.id, 3), (b.id, 2)],
+        )
+
+
+class OrderItemRewriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="editor", password="x")
+        category = Category.objects.create(name="hardware")
+        self.nail, self.screw, self.bolt = [
+            Product.objects.create(
+                name=name, description="Steel", price=price, stock=10, category=category
+            )
+            for name, price in (("Nail", 1), ("Screw", 2), ("Bolt", 3))
+        ]
+        items = [
+            {"product": self.nail.id, "quantity": 4},
+            {"product": self.screw.id, "quantity": 2},
+        ]
+        serializer = OrderSerializer(data={"items": items})
+        serializer.is_valid(raise_exception=True)
+        self.order = serializer.save(user=self.user)
+
+    def update_items(self, *lines):
+        serializer = OrderSerializer(
+            self.order,
+            data={"items": [{"product": p.id, "quantity": q} for p, q in lines]},
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def stock(self):
+        return [
+            Product.objects.get(id=p.id).stock for p in (self.nail, self.screw, self.bolt)
+        ]
+
+    def test_diff_moves_stock_by_delta(self):
+        order = self.update_items((self.nail, 1), (self.bolt, 5))
+
+        self.assertEqual(self.stock(), [9, 10, 5])
+        self.assertEqual(order.total_price, 16)
+        self.assertEqual(
+            sorted(order.items.values_list("product__name", "quantity")),
+            [("Bolt", 5), ("Nail", 1)],
+        )
+
+    def test_uncoverable_increase_changes_nothing(self):
+        with self.assertRaisesMessage(ValidationError, "Not enough stock for Nail."):
+            self.update_items((self.nail, 20))
+        self.assertEqual(self.stock(), [6, 8, 10])
+        self.assertEqual(self.order.items.count(), 2)
+
+    def test_cancelled_order_items_are_frozen(self):
+        Order.objects.filter(id=self.order.id).update(status="Cancelled")
+        restock_orders([self.order.id])
+        self.order.refresh_from_db()
+        with self.assertRaisesMessage(ValidationError, "cancelled"):
+            self.update_items((self.nail, 1))
+        self.assertEqual(self.stock(), [10, 10, 10])
+
+
+class RestockTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="canceller", password="x")
+        category = Category.objects.create(name="paint")
+        self.red, self.blue = [
+            Product.objects.create(
+                name=name, description="Tin", price=5, stock=10, category=category
+            )
+            for name in ("Red", "Blue")
+        ]
+        self.orders = [
+            place_order([(self.red, 2), (self.blue, 1)], user=self.user) for _ in range(3)
+        ]
+
+    def test_bulk_cancel_restocks_in_one_update(self):
+        admin = User.objects.create_user(username="boss", password="x", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        Order.objects.filter(id=self.orders[2].id).update(status="Shipped")
+
+        ids = [order.id for order in self.orders]
+        response = self.client.post("/shop/order_bulk_cancel", {"order_ids": ids}, format="json")
+
+        self.assertEqual(sorted(response.data["cancelled"]), ids[:2])
+        self.red.refresh_from_db()
+        self.blue.refresh_from_db()
+        self.assertEqual((self.red.stock, self.blue.stock), (8, 9))
+
+    def test_restock_loads_no_products(self):
+        with CaptureQueriesContext(connection) as queries:
+            restock_orders([order.id for order in self.orders])
+        selects = [q["sql"] for q in queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('FROM "shop_product"', selects[0])
+        self.red.refresh_from_db()
+        self.assertEqual(self.red.stock, 10)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="b2b", password="x")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="office")
+        paper = Product.objects.create(
+            name="Paper", description="A4", price=3, stock=100, category=category
+        )
+        for _ in range(7):
+            place_order([(paper, 1)], user=self.user)
+        Order.objects.filter(id__in=Order.objects.values("id")[:2]).update(status="Cancelled")
+
+    def test_history_is_filtered_and_cursor_paged(self):
+        url = "/shop/order_create?status=Pending&page_size=2"
+        seen = []
+        while url:
+            with self.assertNumQueries(2):  # orders page + items prefetch
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [order["id"] for order in response.data["results"]]
+            self.assertTrue(all(order["items"] for order in response.data["results"]))
+            url = response.data["next"]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get("/shop/order_create?status=Lost")
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportProductsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        Category.objects.create(name="tools")
+
+    def run_import(self, name, content):
+        path = Path(self.tmp.name) / name
+        path.write_text(content)
+        out, err = StringIO(), StringIO()
+        call_command("import_products", str(path), batch_size=2, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_creates_categories_and_reports_bad_rows(self):
+        out, err = self.run_import(
+            "feed.csv",
+            "name,description,price,stock,category\n"
+            "Hammer,Claw hammer,12.50,4,Tools\n"
+            "Drill,Cordless,80,2,power tools\n"
+            "Broken,,abc,1,tools\n"
+            "Saw,Hand saw,15,3,Tools\n",
+        )
+        self.assertIn("line 4: invalid price 'abc'", err)
+        self.assertIn("3 products imported, 1 rows rejected", out)
+        self.assertEqual(
+            sorted(Category.objects.values_list("name", flat=True)), ["power tools", "tools"]
+        )
+        self.assertEqual(Product.objects.get(name="Drill").category.name, "power tools")
+
+    def test_jsonl_import_upserts_on_name(self):
+        Product.objects.create(
+            name="Hammer", description="Old", price=10, stock=1,
+            category=Category.objects.get(name="tools"),
+        )
+        self.run_import(
+            "feed.jsonl",
+            '{"name": "Hammer", "description": "New", "price": "11", "stock": 9, "category": "tools"}\n'
+            '{"name": "Wrench", "price": 7, "category": "tools"}\n',
+        )
+        hammer = Product.objects.get(name="Hammer")
+        self.assertEqual((hammer.description, hammer.stock), ("New", 9))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_batch_size_must_be_positive(self):
+        path = Path(self.tmp.name) / "feed.jsonl"
+        path.write_text('{"name": "Level", "price": 3, "category": "tools"}\n')
+        for size in (0, -1):
+            with self.assertRaisesMessage(CommandError, "--batch-size must be at least 1"):
+                call_command("import_products", str(path), batch_size=size, stdout=StringIO())
+
+    def test_malformed_values_reject_only_their_row(self):
+        out, err = self.run_import(
+            "feed.jsonl",
+            '{"name": "Level", "price": "NaN", "category": "tools"}\n'
+            '{"name": "Clamp", "price": "Infinity", "category": "tools"}\n'
+            '{"name": 42, "price": 3, "category": "tools"}\n'
+            '{"name": "Vice", "price": 3, "category": ["tools"]}\n'
+            '{"name": "File", "price": 3, "category": "tools"}\n',
+        )
+        self.assertIn("line 1: invalid price 'NaN'", err)
+        self.assertIn("line 2: invalid price 'Infinity'", err)
+        self.assertIn("line 3: name, category and description must be strings", err)
+        self.assertIn("line 4: name, category and description must be strings", err)
+        self.assertIn("1 products imported, 4 rows rejected", out)
+
+
+class ProductExportTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        books = Category.objects.create(name="books")
+        games = Category.objects.create(name="games")
+        for i in range(3):
+            Product.objects.create(
+                name=f"Novel {i}", description="Paperback", price=9, stock=i, category=books
+            )
+        Product.objects.create(
+            name="Puzzle", description="1000 pieces", price=20, stock=1, category=games
+        )
+
+    def body(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_export_with_filters(self):
+        response = self.client.get("/shop/product_export?category=books&include=stock,rating")
+        rows = [json.loads(line) for line in self.body(response).splitlines()]
+
+        self.assertEqual([row["name"] for row in rows], ["Novel 0", "Novel 1", "Novel 2"])
+        self.assertEqual(rows[2]["stock"], 2)
+        self.assertEqual(rows[0]["rating_count"], 0)
+        self.assertEqual(rows[0]["category"], "books")
+
+    def test_csv_export(self):
+        response = self.client.get("/shop/product_export?output=csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = self.body(response).splitlines()
+        self.assertEqual(lines[0], "id,name,description,price,category")
+        self.assertEqual(len(lines), 5)
+
+
+class CatalogChangeFeedTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(user=admin)
+
+    def feed(self, cursor=None, **params):
+        if cursor:
+            params["cursor"] = cursor
+        response = self.client.get("/shop/catalog_changes", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_feed_collapses_and_resumes(self):
+        response = self.client.post(
+            "/shop/product_create",
+            {"name": "Lamp", "description": "Desk", "price": "15.00", "stock": 3, "category": {"name": "home"}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        lamp = Product.objects.get(name="Lamp")
+        response = self.client.put(
+            f"/shop/product_detail/{lamp.id}",
+            {"description": "Desk lamp", "price": "12.00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+        first = self.feed()
+        products = [c for c in first["changes"] if c["type"] == "product"]
+        self.assertEqual(len(products), 1)  # create + update collapse to one entry
+        self.assertEqual(products[0]["data"]["description"], "Desk lamp")
+        self.assertFalse(first["has_more"])
+
+        # Nothing new since the cursor.
+        self.assertEqual(self.feed(first["cursor"])["changes"], [])
+
+        self.client.delete(f"/shop/product_detail/{lamp.id}")
+        later = self.feed(first["cursor"])
+        self.assertEqual(
+            later["changes"], [{"type": "product", "id": lamp.id, "deleted": True}]
+        )
+
+    def test_limit_and_bad_cursor(self):
+        category = Category.objects.create(name="tools")
+        for i in range(3):
+            Product.objects.create(name=f"Tool {i}", description="", price=1, stock=1, category=category)
+        products_changed(Product.objects.values_list("id", flat=True))
+        page = self.feed(limit=2)
+        self.assertTrue(page["has_more"])
+        self.assertEqual(len(page["changes"]), 2)
+        rest = self.feed(page["cursor"], limit=2)
+        self.assertEqual(len(rest["changes"]), 1)
+        self.assertFalse(rest["has_more"])
+
+        response = self.client.get("/shop/catalog_changes", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+        category = Category.objects.create(name="garden")
+        for i in range(7):
+            Product.objects.create(
+                name=f"Rake {i}", description="Steel", price=10 + i, stock=1, category=category
+            )
+        self.product = Product.objects.first()
+
+    async def call(self, view_class, path, user=None, **kwargs):
+        request = self.factory.get(path)
+        if user is not None:
+            force_authenticate(request, user=user)
+        response = await view_class.as_view()(request, **kwargs)
+        return response.render()
+
+    async def test_async_views_match_sync_views(self):
+        admin = await User.objects.acreate(username="admin", is_staff=True)
+        cases = [
+            (async_views.ProductListView, "/shop/product_create?page=2", {}),
+            (async_views.ProductListView, "/shop/product_create?pagination=cursor&ordering=price", {}),
+            (async_views.ProductDetailView, f"/shop/product_detail/{self.product.id}", {"product_id": self.product.id}),
+            (async_views.CategoryListView, "/shop/category_list", {}),
+        ]
+        for view_class, path, kwargs in cases:
+            await sync_to_async(self.client.force_authenticate)(user=admin)
+            expected = await sync_to_async(self.client.get)(path)
+            actual = await self.call(view_class, path, user=admin, **kwargs)
+            self.assertEqual(actual.status_code, 200)
+            self.assertEqual(json.loads(actual.content), json.loads(expected.content), path)
+
+    async def test_async_views_keep_sync_errors_and_permissions(self):
+        missing = await self.call(async_views.ProductDetailView, "/x", product_id=0)
+        self.assertEqual(missing.status_code, 404)
+        bad_page = await self.call(async_views.ProductListView, "/shop/product_create?page=9")
+        self.assertEqual(bad_page.status_code, 404)
+
+    def test_route_sends_only_reads_to_the_async_view(self):
+        self.assertIs(async_views.route(views.product_create, async_views.ProductListView), views.product_create)
+        with self.settings(ASYNC_READ_VIEWS=True):
+            view = async_views.route(views.product_create, async_views.ProductListView)
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+
+        response = async_to_sync(view)(self.factory.get("/shop/product_create"))
+        self.assertEqual(response.render().status_code, 200)
+        request = self.factory.post(
+            "/shop/product_create",
+            {"name": "Hoe", "description": "Short", "price": "5.00", "stock": 1, "category": {"name": "tools"}},
+            content_type="application/json",
+        )
+        force_authenticate(request, user=admin)
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.render().status_code, 201, response.data)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.user = User.objects.create_user(
+            username="staffer", email="staff@example.com", password="secret1", is_staff=True
+        )
+        self.access = str(ClaimsRefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self, token):
+        request = APIClient().get("/").wsgi_request
+        request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_user_comes_from_claims_and_loads_lazily(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate(self.access)
+            self.assertEqual((user.id, user.is_staff, user.is_active), (self.user.id, True, True))
+            self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual((user.username, user.email), ("staffer", "staff@example.com"))
+
+    def test_login_token_authorizes_admin_writes(self):
+        client = APIClient()
+        response = client.post("/shop/login", {"username": "staffer", "password": "secret1"})
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access_token']}")
+        response = client.post("/shop/category_list", {"name": "kitchen"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        legacy = str(RefreshToken.for_user(self.user).access_token)
+        with self.assertNumQueries(1):
+            user = self.authenticate(legacy)
+        self.assertEqual(user.username, "staffer")
+
+    def test_refresh_picks_up_a_demotion(self):
+        client = APIClient()
+        tokens = client.post("/shop/login", {"username": "staffer", "password": "secret1"}).data
+        self.user.is_staff = False
+        self.user.save()
+
+        refreshed = client.post("/api/token/refresh/", {"refresh": tokens["refresh_token"]})
+        self.assertEqual(refreshed.status_code, 200)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+        self.assertEqual(client.post("/shop/category_list", {"name": "garage"}).status_code, 403)
+
+        # The rotated refresh token doesn't bring the old role back either.
+        again = client.post("/api/token/refresh/", {"refresh": refreshed.data["refresh"]})
+        self.assertFalse(ClaimsRefreshToken(again.data["refresh"])["is_staff"])
+
+    def test_inactive_claim_is_rejected(self):
+        self.user.is_active = False
+        token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+class RefreshTokenBlacklistTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        revocations.reset()
+        self.client = APIClient()
+        user = User.objects.create_user(username="rotor", password="x")
+        self.refresh = str(ClaimsRefreshToken.for_user(user))
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        response = self.client.post("/api/token/refresh/", {"refresh": self.refresh})
+        self.assertEqual(response.status_code, 200)
+        rotated = response.data["refresh"]
+
+        reused = self.client.post("/api/token/refresh/", {"refresh": self.refresh})
+        self.assertEqual(reused.status_code, 401)
+        verify = self.client.post("/api/token/verify/", {"token": self.refresh})
+        self.assertEqual(verify.status_code, 400)
+
+        self.assertEqual(self.client.post("/api/token/verify/", {"token": rotated}).status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_refresh_refuses_revocations_the_filter_has_not_synced(self):
+        revocations.is_revoked(uuid.uuid4().hex)  # filter built before the revocation
+        token = ClaimsRefreshToken(self.refresh)
+        RevokedToken.objects.create(
+            jti=token["jti"], expires_at=timezone.now() + timedelta(hours=1)
+        )
+        response = self.client.post("/api/token/refresh/", {"refresh": self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_does_not_read_the_revocation_table(self):
+        revocations.is_revoked(uuid.uuid4().hex)  # builds the filter
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/token/refresh/", {"refresh": self.refresh})
+        self.assertEqual(response.status_code, 200)
+        reads = [
+            q["sql"] for q in queries.captured_queries
+            if q["sql"].startswith("SELECT") and "shop_revokedtoken" in q["sql"]
+        ]
+        self.assertEqual(reads, [])
+
+    def test_concurrent_rotation_has_one_winner(self):
+        # Both requests verified the token before either revoked it.
+        first, second = ClaimsRefreshToken(self.refresh), ClaimsRefreshToken(self.refresh)
+        first.blacklist()
+        with self.assertRaisesMessage(TokenError, "Token is blacklisted"):
+            second.blacklist()
+
+    def test_unrevoked_tokens_are_checked_without_queries(self):
+        revocations.is_revoked(uuid.uuid4().hex)  # builds the filter
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertFalse(revocations.is_revoked(uuid.uuid4().hex))
+
+    def test_revocations_from_other_processes_are_picked_up(self):
+        revocations.is_revoked(uuid.uuid4().hex)
+        jti = uuid.uuid4()
+        RevokedToken.objects.create(jti=jti, expires_at=timezone.now() + timedelta(hours=1))
+        with self.settings(TOKEN_BLACKLIST={"SYNC_INTERVAL": 0}):
+            self.assertTrue(revocations.is_revoked(jti.hex))
+
+    def test_rebuild_drops_expired_tokens(self):
+        expired = uuid.uuid4()
+        RevokedToken.objects.create(jti=expired, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(revocations.is_revoked(expired.hex))
+        self.assertFalse(RevokedToken.objects.exists())
+
+
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+
+    def test_buckets_are_shared_between_store_instances(self):
+        worker_a, worker_b = BucketStore(), BucketStore()
+        taken = [store.take("ip:1", 4, 0.001) for store in (worker_a, worker_b) * 3]
+        self.assertEqual(taken, [True] * 4 + [False] * 2)
+        self.assertTrue(worker_b.take("ip:2", 4, 0.001))
+
+    def test_bucket_refills_over_time(self):
+        self.assertTrue(buckets.take("refill", 1, 1000))
+        time.sleep(0.01)
+        self.assertTrue(buckets.take("refill", 1, 1000))
+        self.assertTrue(buckets.take("slow", 1, 0.001))
+        self.assertFalse(buckets.take("slow", 1, 0.001))
+
+    def test_login_throttle_returns_429_with_retry_after(self):
+        client = APIClient()
+        statuses = [
+            client.post("/shop/login", {"username": "x", "password": "y"}).status_code
+            for _ in range(6)
+        ]
+        self.assertEqual(statuses, [400] * 5 + [429])
+        response = client.post("/shop/login", {"username": "x", "password": "y"})
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_login_and_browsing_have_separate_buckets(self):
+        client = APIClient()
+        for _ in range(5):
+            client.post("/shop/login", {"username": "x", "password": "y"})
+        self.assertEqual(client.get("/shop/category_list").status_code, 200)
+        for _ in range(9):
+            client.get("/shop/category_list")
+        self.assertEqual(client.get("/shop/category_list").status_code, 429)
+        self.assertEqual(
+            client.post("/shop/login", {"username": "x", "password": "y"}).status_code, 429
+        )
+
+    def test_login_throttle_fails_closed_when_the_store_is_busy(self):
+        client = APIClient()
+        locked = sqlite3.OperationalError("database is locked")
+        with mock.patch.object(BucketStore, "_connect", side_effect=locked):
+            login = client.post("/shop/login", {"username": "x", "password": "y"})
+            listing = client.get("/shop/category_list")
+        self.assertEqual(login.status_code, 429)
+        self.assertEqual(listing.status_code, 200)
+
+
+class UserListingTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        for name in ["alice", "alfred", "bob", "Albert"]:
+            user = User.objects.create_user(username=name, email=f"{name.upper()}@Example.com")
+            UserProfile.objects.create(user=user, phone="123")
+        self.client.force_authenticate(user=User(username="admin", is_staff=True))
+
+    def test_listing_is_admin_only(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get("/shop/user_create?email=al").status_code, 401)
+        self.client.force_authenticate(user=User.objects.get(username="bob"))
+        self.assertEqual(self.client.get("/shop/user_create?email=al").status_code, 403)
+
+    def test_profile_is_opt_in(self):
+        response = self.client.get("/shop/user_create")
+        self.assertEqual(set(response.data["results"][0]), {"id", "username", "email"})
+
+    def test_listing_is_cursor_paged(self):
+        url = "/shop/user_create?page_size=3"
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [user["username"] for user in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(names, ["alice", "alfred", "bob", "Albert"])
+
+    def test_fields_projection_prunes_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/shop/user_create?fields=id,username")
+        self.assertEqual(set(response.data["results"][0]), {"id", "username"})
+        listing = [q["sql"] for q in queries.captured_queries if "auth_user" in q["sql"]]
+        self.assertEqual(len(listing), 1)
+        self.assertNotIn("email", listing[0])
+        self.assertNotIn("profile", listing[0])
+
+        response = self.client.get("/shop/user_create?fields=username,profile")
+        self.assertEqual(response.data["results"][0]["profile"]["phone"], "123")
+        self.assertEqual(self.client.get("/shop/user_create?fields=password").status_code, 400)
+
+    def test_prefix_filters(self):
+        response = self.client.get("/shop/user_create?username=al&fields=username")
+        self.assertEqual([u["username"] for u in response.data["results"]], ["alice", "alfred"])
+        response = self.client.get("/shop/user_create?email=AL&fields=username")
+        self.assertEqual(
+            [u["username"] for u in response.data["results"]], ["alice", "alfred", "Albert"]
+        )
+
+
+class EmailUniquenessTests(TestCase):
+    def setUp(self):
+        isolate_stores(self)
+        self.client = APIClient()
+        self.existing = User.objects.create_user(username="first", email="Jane@Example.com")
+
+    def signup(self, username, email):
+        return self.client.post(
+            "/shop/user_create",
+            {"username": username, "email": email, "password": "x", "profile": {"phone": "1"}},
+            format="json",
+        )
+
+    def test_signup_email_check_ignores_case(self):
+        response = self.signup("second", "jane@example.COM")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.data)
+        self.assertEqual(self.signup("third", "other@example.com").status_code, 201)
+        # Users without an email never collide.
+        self.assertEqual(self.signup("fourth", "").status_code, 201)
+        self.assertEqual(self.signup("fifth", "").status_code, 201)
+
+    def test_email_check_folds_case_like_the_index(self):
+        # SQLite's LOWER() leaves non-ASCII letters alone: both emails
+        # index as "jane@ÉXAMPLE.com", while str.lower() gives "jane@éxample.com".
+        User.objects.create(username="emile", email="jane@ÉXAMPLE.com")
+        other = User.objects.create_user(username="other", email="other@example.com")
+        UserProfile.objects.create(user=other)
+        self.client.force_authenticate(user=other)
+        response = self.client.put(
+            f"/shop/user_detail/{other.id}", {"email": "JANE@ÉXAMPLE.com"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.data)
+
+    def test_lost_race_is_a_validation_error(self):
+        # Simulate a concurrent signup that passed validation first.
+        serializer = UserSerializer(
+            data={"username": "racer", "email": "JANE@example.com", "password": "x", "profile": {}}
+        )
+        with mock.patch.object(UserSerializer, "validate_email", lambda self, value: value):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            with self.assertRaises(ValidationError) as raised:
+                serializer.save()
+        self.assertIn("email", raised.exception.detail)
+        self.assertFalse(User.objects.filter(username="racer").exists())
+
+    def test_update_keeps_own_email(self):
+        serializer = UserSerializer(
+            instance=self.existing, data={"email": "JANE@example.com"}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_lost_race_on_update_is_a_400(self):
+        other = User.objects.create_user(username="other", email="other@example.com")
+        UserProfile.objects.create(user=other)
+        self.client.force_authenticate(user=other)
+        with mock.patch.object(UserSerializer, "validate_email", lambda self, value: value):
+            response = self.client.put(
+                f"/shop/user_detail/{other.id}", {"email": "jane@EXAMPLE.com"}, format="json"
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.data)
+
+
+def png_upload(name="me.png", color="red"):
+    buffer = BytesIO()
+    Image.new("RGB", (300, 200), color).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ProfilePictureVariantTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media.name, PROFILE_IMAGES={"SIZES": [64], "WORKERS": 0}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def create_user(self, username, picture):
+        serializer = UserSerializer(
+            data={
+                "username": username,
+                "email": "",
+                "password": "x",
+                "profile": {"phone": "1", "profile_picture": picture},
+            }
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def test_variants_rendered_after_commit(self):
+        user = self.create_user("pic", png_upload())
+        profile = UserProfile.objects.get(user=user)
+        self.assertTrue(profile.picture_ready)
+        self.assertEqual(
+            profile.profile_picture.name,
+            f"user_image/{profile.picture_hash[:2]}/{profile.picture_hash}.png",
+        )
+
+        variants = UserSerializer(profile.user).data["profile"]["profile_picture_variants"]
+        self.assertEqual(set(variants["64"]), {"webp", "jpeg"})
+        for ext in ("webp", "jpeg"):
+            path = Path(self.media.name) / variant_name(profile.picture_hash, 64, ext)
+            with Image.open(path) as image:
+                self.assertEqual(image.size, (64, 64))
+
+    def test_same_content_is_stored_once(self):
+        first = self.create_user("one", png_upload("a.png"))
+        with mock.patch("shop.images.schedule_variants") as schedule:
+            second = self.create_user("two", png_upload("b.png"))
+        schedule.assert_not_called()  # variants already exist
+        first, second = first.profile, UserProfile.objects.get(user=second)
+        self.assertEqual(first.profile_picture.name, second.profile_picture.name)
+        self.assertTrue(second.picture_ready)
+        originals = list((Path(self.media.name) / "user_image").glob("*/*.png"))
+        self.assertEqual(len(originals), 1)
+
+    def test_not_ready_until_rendered(self):
+        with mock.patch("shop.images.schedule_variants"):
+            user = self.create_user("slow", png_upload(color="blue"))
+        self.assertIsNone(UserSerializer(user).data["profile"]["profile_picture_variants"])
+
+    def test_command_renders_lost_and_legacy_pictures(self):
+        with mock.patch("shop.images.schedule_variants"):  # render lost
+            lost = self.create_user("lost", png_upload(color="blue")).profile
+        legacy = UserProfile.objects.create(
+            user=User.objects.create_user(username="legacy"),
+            profile_picture=default_storage.save("user_image/old.png", png_upload(color="green")),
+        )
+        out = StringIO()
+        call_command("render_profile_variants", stdout=out)
+        self.assertIn("Rendered variants for 2 pictures", out.getvalue())
+
+        for profile in (lost, legacy):
+            profile.refresh_from_db()
+            self.assertTrue(profile.picture_ready)
+            self.assertTrue(default_storage.exists(variant_name(profile.picture_hash, 64, "webp")))
+
+
+class ProfilePicturePoolTests(TransactionTestCase):
+    """The process pool itself, including recovery from a dead worker."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=media.name, PROFILE_IMAGES={"SIZES": [64], "WORKERS": 1}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(images.shutdown_pool)
+
+    def upload(self, username, color):
+        user = User.objects.create_user(username=username)
+        profile = UserProfile.objects.create(user=user)
+        images.attach_picture(profile, png_upload(color=color))
+        deadline = time.monotonic() + 60
+        while not UserProfile.objects.get(id=profile.id).picture_ready:
+            self.assertLess(time.monotonic(), deadline, "variants were never rendered")
+            time.sleep(0.05)
+
+    def test_renders_in_pool_and_survives_a_dead_worker(self):
+        self.upload("first", "red")
+
+        broken = images._get_pool(1)
+        dying = broken.submit(os._exit, 1)  # like an OOM kill
+        with self.assertRaises(BrokenProcessPool):
+            dying.result(timeout=60)
+
+        self.upload("second", "blue")
+        self.assertIsNot(images._get_pool(1), broken)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        (Path(media.name) / "docs").mkdir()
+        (Path(media.name) / "docs" / "a.txt").write_bytes(b"0123456789")
+        self.url = "/media/docs/a.txt"
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b"0123456789")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("max-age=3600", response["Cache-Control"])
+
+        etag, modified = response["ETag"], response["Last-Modified"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(self.url, headers={"If-Modified-Since": modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=2-4"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b"234")
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(response["Content-Length"], "3")
+
+        response = self.client.get(self.url, headers={"Range": "bytes=-3"})
+        self.assertEqual(self.body(response), b"789")
+        self.assertEqual(response["Content-Length"], "3")
+
+        response = self.client.get(self.url, headers={"Range": "bytes=20-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+        (Path(settings.MEDIA_ROOT) / "docs" / "empty.txt").write_bytes(b"")
+        for header in ("bytes=-5", "bytes=0-"):
+            response = self.client.get("/media/docs/empty.txt", headers={"Range": header})
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */0")
+
+        # A stale If-Range gets the whole (changed) file.
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=2-4", "If-Range": '"stale"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b"0123456789")
+
+    def test_missing_and_escaping_paths_404(self):
+        self.assertEqual(self.client.get("/media/docs/nope.txt").status_code, 404)
+        self.assertEqual(self.client.get("/media/docs").status_code, 404)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+
+    def test_handoff_backends(self):
+        with self.settings(MEDIA_SERVING={"BACKEND": "x-accel-redirect"}):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/docs/a.txt")
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+        with self.settings(MEDIA_SERVING={"BACKEND": "x-sendfile"}):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], str(Path(settings.MEDIA_ROOT) / "docs" / "a.txt"))
@@ -0,0 +1,164 @@
+"""
+Token-bucket throttles shared by every worker process on a host.
+
+DRF's throttles keep a list of request timestamps per client in Django's
+cache. With the default LocMem cache each worker counts on its own, so N
+workers allow N times the configured rate, and every request rewrites
+the whole list.
+
+Here each client has a bucket of `num_requests` tokens that refills at
+the configured rate. Buckets live in a small SQLite file (WAL mode) that
+all processes open. A check is a single UPSERT that refills the bucket
+and takes a token only if one is available. If the store is busy for
+longer than BUSY_TIMEOUT (or broken) the request is let through rather
+than held up, unless the throttle sets `fail_open = False`. Throttles
+that guard against abuse, like LoginThrottle, must: contention peaks
+exactly during the burst they exist to stop.
+
+Configured by the THROTTLE_STORE setting:
+
+    THROTTLE_STORE = {
+        "PATH": "/tmp/xstore-throttle.sqlite3",  # shared by all workers
+        "BUSY_TIMEOUT": 0.05,                    # seconds
+        "IDLE_EXPIRY": 86400,                    # drop buckets unused this long
+    }
+"""
+
+import logging
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.throttling import AnonRateThrottle, SimpleRateThrottle, UserRateThrottle
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "PATH": Path(tempfile.gettempdir()) / "xstore-throttle.sqlite3",
+    "BUSY_TIMEOUT": 0.05,
+    "IDLE_EXPIRY": 86400,
+}
+
+# Expired buckets are swept on about one check in this many.
+SWEEP_EVERY = 1000
+
+TAKE_TOKEN = """
+INSERT INTO bucket (key, tokens, updated_at) VALUES (:key, :capacity - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated_at) * :refill) - 1,
+    updated_at = :now
+WHERE min(:capacity, tokens + (:now - updated_at) * :refill) >= 1
+RETURNING tokens
+"""
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "THROTTLE_STORE", {})}
+
+
+class BucketStore:
+    """Token buckets in a SQLite file, one connection per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        config = _config()
+        path = str(config["PATH"])
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.path == path:
+            return conn
+
+        conn = sqlite3.connect(
+            path, timeout=config["BUSY_TIMEOUT"], isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # losing a few tokens on a crash is fine
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bucket ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._local.conn, self._local.path = conn, path
+        return conn
+
+    def take(self, key, capacity, refill, fail_open=True):
+        """
+        Take a token from `key`'s bucket (`capacity` tokens, refilled at
+        `refill` tokens per second). Returns True if one was available,
+        and `fail_open` if the store can't be reached.
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                TAKE_TOKEN, {"key": key, "capacity": capacity, "refill": refill, "now": now}
+            ).fetchone()
+            if random.randrange(SWEEP_EVERY) == 0:
+                conn.execute(
+                    "DELETE FROM bucket WHERE updated_at < ?", (now - _config()["IDLE_EXPIRY"],)
+                )
+        except sqlite3.Error:
+            logger.warning(
+                "Throttle store unavailable; %s request",
+                "allowing" if fail_open else "denying",
+                exc_info=True,
+            )
+            return fail_open
+        return row is not None
+
+    def tokens(self, key, capacity, refill):
+        """Tokens currently in `key`'s bucket (a fraction if partly refilled)."""
+        try:
+            row = self._connect().execute(
+                "SELECT tokens, updated_at FROM bucket WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return capacity
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + (time.time() - row[1]) * refill)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM bucket")
+
+
+buckets = BucketStore()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle backed by a shared token bucket. Rates and cache
+    keys come from the usual DRF settings and subclasses; "5/min" allows
+    a burst of 5 and then one request every 12 seconds.
+    """
+
+    # What to do when the bucket store errors or stays busy.
+    fail_open = True
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        return buckets.take(
+            self.key, self.num_requests, self.num_requests / self.duration, self.fail_open
+        )
+
+    def wait(self):
+        refill = self.num_requests / self.duration
+        missing = 1 - buckets.tokens(self.key, self.num_requests, refill)
+        return max(missing, 0) / refill
+
+
+class AnonBucketThrottle(TokenBucketThrottle, AnonRateThrottle):
+    pass
+
+
+class UserBucketThrottle(TokenBucketThrottle, UserRateThrottle):
+    pass
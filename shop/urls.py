@@ -1,7 +1,8 @@
 from django.urls import path
-from . import views
+from . import async_views, views
+from .async_views import route
 from rest_framework_simplejwt.views import  TokenObtainPairView, TokenRefreshView,TokenVerifyView 
-from reviews.views import add_review, get_reviews  # import from reviews app
+
 
 
 urlpatterns = [
@@ -13,21 +14,25 @@ urlpatterns = [
     path("login",  views.login_user, name="user-login"),
     path("user_detail/<int:user_id>", views.user_detail, name="user_detail"),
     
-    path("category_list", views.category_list, name="category_list"),
+    path("category_list", route(views.category_list, async_views.CategoryListView), name="category_list"),
     path("category_detail/<int:category_id>", views.category_detail, name="category_detail"),
     
-    path("product_create", views.product_create, name="product_create"),
-    path("product_detail/<int:product_id>", views.product_detail, name="product_detail"),
+    path("product_create", route(views.product_create, async_views.ProductListView), name="product_create"),
+    path("product_detail/<int:product_id>", route(views.product_detail, async_views.ProductDetailView), name="product_detail"),
+    path("product_export", views.product_export, name="product_export"),
+    path("catalog_changes", views.catalog_changes, name="catalog_changes"),
+    path("product_cache_stats", views.product_cache_stats, name="product_cache_stats"),
 
     path("cart_list_create", views.cart_list_create, name="cart_list_create"),
+    path("cart_bulk_upsert", views.cart_bulk_upsert, name="cart_bulk_upsert"),
     path("cart_detail/<int:cart_id>", views.cart_detail, name="cart_detail"),
 
     path("order_create", views.order_create, name="order_create"),
+    path("checkout", views.checkout, name="checkout"),
+    path("order_bulk_cancel", views.order_bulk_cancel, name="order_bulk_cancel"),
     path("order_detail/<int:order_id>", views.order_detail, name="order_detail"),
 
 
-    path("products/<int:object_id>/reviews/add/", add_review, name="product-review-add"),
-    path("products/<int:object_id>/reviews/", get_reviews, name="product-review-list"),
 
     
 ]
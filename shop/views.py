@@ -1,3 +1,9 @@
+import base64
+import binascii
+import csv
+import itertools
+import json
+
 from rest_framework.response import Response
 from rest_framework.decorators import (
     api_view,
@@ -6,22 +12,41 @@ from rest_framework.decorators import (
 )
 
 from rest_framework import generics, mixins
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.throttling import AnonRateThrottle
 
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 
 
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from .permissions import IsAdminOrReadOnly, IsUserSelf
-from .filter import ProductFilter
-from .models import Category, Product, Cart, Order
+from reviews.summary import format_summary, with_rating_summary
+
+from .authentication import ClaimsRefreshToken
+from .permissions import IsAdminOrReadOnly, IsAdminOrSignup, IsUserSelf
+from .cache import (
+    get_listing,
+    get_product_payload,
+    invalidate_products,
+    listing_cache_key,
+    product_cache,
+    set_listing,
+)
+from .changes import categories_changed, products_changed
+from .emails import by_email
+from .filter import OrderFilter, ProductFilter
+from .orders import EmptyCart, cancel_orders, checkout_cart
+from .pagination import OrderCursorPagination, ProductCursorPagination, UserCursorPagination
+from .search import search_products
+from .models import CatalogChange, Category, Product, Cart, Order, OrderItem
+from .stock import InsufficientStock
+from .throttling import AnonBucketThrottle
 from .serializer import (
     UserSerializer,
     CategorySerializer,
@@ -34,16 +59,72 @@ from .serializer import (
 # Create your views here.
 
 
+# `?fields=` name -> columns it needs.
+USER_LIST_FIELDS = {
+    "id": ["id"],
+    "username": ["username"],
+    "email": ["email"],
+    "profile": [
+        "profile__phone",
+        "profile__address",
+        "profile__profile_picture",
+        "profile__picture_hash",
+        "profile__picture_ready",
+    ],
+}
+
+
+# The profile (and its picture URLs) only when asked for with ?fields=.
+USER_LIST_DEFAULT_FIELDS = ["id", "username", "email"]
+
+
+def prefix_range(prefix):
+    """gte/lt bounds matching every string that starts with `prefix`."""
+    return {"gte": prefix, "lt": prefix + "\U0010ffff"}
+
+
+# The listing exposes emails and has an email prefix search, so it is
+# admin-only; signing up stays open to everyone.
 @api_view(["GET", "POST"])
-@permission_classes([AllowAny])
+@permission_classes([IsAdminOrSignup])
 def user_list_create(request):
     if request.method == "GET":
-        authentication_classes([JWTAuthentication])
-        permission_classes([IsAuthenticated])
+        fields = [name for name in request.GET.get("fields", "").split(",") if name]
+        unknown = set(fields) - USER_LIST_FIELDS.keys()
+        if unknown:
+            return Response(
+                {"error": f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400
+            )
+        fields = fields or USER_LIST_DEFAULT_FIELDS
 
-        users = User.objects.select_related("profile").all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        # Only the requested columns are loaded, plus what the ordering needs.
+        columns = {"id", "username"}.union(
+            *(USER_LIST_FIELDS[name] for name in fields)
+        )
+        users = User.objects.only(*columns)
+        if "profile" in fields:
+            users = users.select_related("profile")
+
+        # Prefix filters are range scans, so they use the username index and
+        # the LOWER(email) index (see shop.emails) instead of LIKE.
+        username = request.GET.get("username")
+        if username:
+            users = users.filter(
+                **{f"username__{op}": value for op, value in prefix_range(username).items()}
+            )
+        email = request.GET.get("email")
+        if email:
+            users = by_email(users).filter(
+                **{
+                    f"email_lower__{op}": value
+                    for op, value in prefix_range(email.lower()).items()
+                }
+            )
+
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(users, request)
+        serializer = UserSerializer(page, many=True, context={"fields": fields})
+        return paginator.get_paginated_response(serializer.data)
 
     elif request.method == "POST":
 
@@ -52,7 +133,7 @@ def user_list_create(request):
             user = serializer.save()
 
             # Generate JWT tokens for the newly created user
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             access_token = str(refresh.access_token)
 
             return Response(
@@ -68,8 +149,9 @@ def user_list_create(request):
     return Response({"message": "Invalid request"}, status=400)
 
 
-class LoginThrottle(AnonRateThrottle):
-    rate = "5/min"
+class LoginThrottle(AnonBucketThrottle):
+    scope = "login"  # own bucket; browsing mustn't spend login attempts
+    fail_open = False  # a busy store must not switch off brute-force protection
 
 
 @api_view(["POST"])
@@ -87,7 +169,7 @@ def login_user(request):
     try:
         user = authenticate(username=username, password=password)
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response(
                 {
                     "message": "Login successful",
@@ -106,37 +188,34 @@ def login_user(request):
 @api_view(["GET", "PUT", "DELETE"])
 @permission_classes([IsAuthenticated, IsUserSelf])
 def user_detail(request, user_id):
-    try:
-        user = get_object_or_404(User, id=user_id)
-
-        # if request.user != user:
-        #     return Response(
-        #         {"error": "You are not allowed to update this profile."}, status=403
-        #     )
-
-        if request.method == "GET":
-            serializer = UserSerializer(user)
-            return Response(serializer.data)
-
-        elif request.method == "PUT":
-            serializer = UserSerializer(instance=user, data=request.data, partial=True)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(
-                    {"message": "User updated successfully", "data": serializer.data},
-                    status=200,
-                )
-            return Response(serializer.errors, status=400)
-
-        elif request.method == "DELETE":
-            user.delete()
+    user = get_object_or_404(User, id=user_id)
+
+    # if request.user != user:
+    #     return Response(
+    #         {"error": "You are not allowed to update this profile."}, status=403
+    #     )
+
+    if request.method == "GET":
+        serializer = UserSerializer(user)
+        return Response(serializer.data)
+
+    elif request.method == "PUT":
+        serializer = UserSerializer(instance=user, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
             return Response(
-                {"message": "User deleted successfully"},
+                {"message": "User updated successfully", "data": serializer.data},
                 status=200,
             )
-        return Response({"message": "Invalid request"}, status=400)
-    except:
-        print('An exception occurred')
+        return Response(serializer.errors, status=400)
+
+    elif request.method == "DELETE":
+        user.delete()
+        return Response(
+            {"message": "User deleted successfully"},
+            status=200,
+        )
+    return Response({"message": "Invalid request"}, status=400)
 
 @api_view(["GET", "POST"])
 @permission_classes([IsAdminOrReadOnly])
@@ -149,7 +228,8 @@ def category_list(request):
     elif request.method == "POST":
         serializer = CategorySerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            category = serializer.save()
+            categories_changed([category.id])
             return Response(
                 {
                     "message": "Data received successfully",
@@ -184,6 +264,9 @@ def category_detail(request, category_id):
         serializer = CategorySerializer(instance=category, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            # Product payloads embed the category.
+            invalidate_products(category.category.values_list("id", flat=True))
+            categories_changed([category.id])
             return Response(
                 {"message": "Category updated successfully", "data": serializer.data},
                 status=200,
@@ -191,7 +274,10 @@ def category_detail(request, category_id):
         return Response(serializer.errors, status=400)
 
     elif request.method == "DELETE":
+        product_ids = list(category.category.values_list("id", flat=True))
         category.delete()
+        products_changed(product_ids, deleted=True)
+        categories_changed([category_id], deleted=True)
         return Response(
             {"message": "Category deleted successfully"},
             status=204,
@@ -221,26 +307,54 @@ def category_detail(request, category_id):
 #     serializer_class = CategorySerializer
 #     permission_classes = [IsAdminOrReadOnly]
 
+def filter_products(request, with_rating=True):
+    """
+    Apply ProductFilter and `?search=` to the product listing queryset.
+    Invalid filters raise ValidationError (a 400 with the filter errors).
+    """
+    products = Product.objects.select_related("category")
+    if with_rating:
+        products = with_rating_summary(products)
+
+    filterset = ProductFilter(request.GET, queryset=products)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    queryset = filterset.qs
+
+    search_query = request.GET.get("search", "")
+    if search_query:
+        queryset = search_products(queryset, search_query)
+    return queryset
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAdminOrReadOnly])
 def product_create(request):
     if request.method == "GET":
-        products = Product.objects.select_related("category")
-
-        filterset = ProductFilter(request.GET, queryset=products)
-        if filterset.is_valid():
-            queryset = filterset.qs
-
-        search_query = request.GET.get("search", "")
-        if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-
-        paginator = PageNumberPagination()
-        paginator.page_size = 5
+        # Anonymous pages are shared by everyone, so they can be cached whole.
+        cache_key = None
+        if not request.user.is_authenticated:
+            cache_key = listing_cache_key(request)
+            cached = get_listing(cache_key)
+            if cached is not None:
+                return Response(cached)
+
+        queryset = filter_products(request)
+
+        # `?pagination=cursor` switches to keyset pages (no COUNT, no OFFSET);
+        # the links it hands out carry `cursor`, which keeps the mode.
+        if "cursor" in request.GET or request.GET.get("pagination") == "cursor":
+            paginator = ProductCursorPagination()
+        else:
+            paginator = PageNumberPagination()
+            paginator.page_size = 5
         paginated_queryset = paginator.paginate_queryset(queryset, request)
 
         serializer = ProductSerializer(paginated_queryset, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if cache_key:
+            set_listing(cache_key, response.data)
+        return response
 
     elif request.method == "POST":
         serializer = ProductSerializer(data=request.data)
@@ -258,13 +372,88 @@ def product_create(request):
     return Response({"message": "Invalid request"}, status=400)
 
 
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+EXPORT_FIELDS = ["id", "name", "description", "price", "category"]
+
+
+def export_rows(queryset, fields):
+    for product in queryset.iterator(chunk_size=2000):
+        row = {
+            "id": product.id,
+            "name": product.name,
+            "description": product.description,
+            "price": str(product.price),
+            "category": product.category.name,
+            "stock": product.stock,
+        }
+        if "rating_count" in fields:
+            rating = format_summary(product.rating_summary)
+            row["rating_count"] = rating["count"]
+            row["rating_average"] = rating["average"]
+        yield {field: row[field] for field in fields}
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminOrReadOnly])
+def product_export(request):
+    """
+    Stream the whole (optionally filtered) catalog as NDJSON or CSV.
+
+    `?output=ndjson|csv`, `?include=stock,rating` plus the usual
+    ProductFilter / `search` parameters. Rows are read with a chunked
+    iterator and written as they come, so memory stays flat.
+    """
+    output = request.GET.get("output", "ndjson")
+    if output not in ("ndjson", "csv"):
+        return Response({"error": "output must be ndjson or csv"}, status=400)
+
+    include = set(request.GET.get("include", "").split(","))
+    fields = list(EXPORT_FIELDS)
+    if "stock" in include:
+        fields.append("stock")
+    if "rating" in include:
+        fields += ["rating_count", "rating_average"]
+
+    queryset = filter_products(request, with_rating="rating" in include).order_by("id")
+    rows = export_rows(queryset, fields)
+
+    if output == "csv":
+        writer = csv.DictWriter(Echo(), fieldnames=fields)
+        body = itertools.chain(
+            [writer.writeheader()], (writer.writerow(row) for row in rows)
+        )
+        content_type = "text/csv"
+    else:
+        body = (json.dumps(row) + "\n" for row in rows)
+        content_type = "application/x-ndjson"
+
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="products.{output}"'
+    return response
+
+
 @api_view(["GET", "DELETE", "PUT"])
 @permission_classes([IsAdminOrReadOnly])
 def product_detail(request, product_id):
     if request.method == "GET":
-        product = Product.objects.select_related('category').get(id=product_id)
-        serializer = ProductSerializer(product)
-        return Response(serializer.data)
+        payload = get_product_payload(
+            product_id,
+            lambda: dict(
+                ProductSerializer(
+                    get_object_or_404(
+                        with_rating_summary(Product.objects.select_related("category")),
+                        id=product_id,
+                    )
+                ).data
+            ),
+        )
+        return Response(payload)
 
     elif request.method == "PUT":
         if not product_id:
@@ -289,6 +478,7 @@ def product_detail(request, product_id):
     elif request.method == "DELETE":
         product = Product.objects.get(id=product_id)
         product.delete()
+        products_changed([product_id], deleted=True)
         return Response(
             {"message": "product deleted successfully"},
             status=200,
@@ -297,6 +487,81 @@ def product_detail(request, product_id):
     return Response(serializer.errors, status=400)
 
 
+def encode_feed_cursor(position):
+    return base64.urlsafe_b64encode(f"feed:{position}".encode()).decode()
+
+
+def decode_feed_cursor(cursor):
+    prefix, _, position = base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+    if prefix != "feed":
+        raise ValueError(cursor)
+    return int(position)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminOrReadOnly])
+def catalog_changes(request):
+    """
+    Delta-sync feed: product and category changes since `?cursor=`.
+
+    Changes are collapsed to the latest state per object. Live objects come
+    with their current payload; deleted ones are tombstones. Pass the
+    returned cursor back to continue. Without a cursor the feed starts from
+    the beginning of the log.
+    """
+    try:
+        position = decode_feed_cursor(request.GET["cursor"]) if "cursor" in request.GET else 0
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return Response({"error": "Invalid cursor"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get("limit", 500)), 1), 1000)
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=400)
+
+    entries = list(CatalogChange.objects.filter(id__gt=position).order_by("id")[: limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        key = (entry.entity, entry.object_id)
+        latest.pop(key, None)  # keep the order of each object's last change
+        latest[key] = entry
+
+    def live_ids(entity):
+        return [oid for (kind, oid), entry in latest.items() if kind == entity and not entry.deleted]
+
+    products = with_rating_summary(Product.objects.select_related("category")).in_bulk(
+        live_ids(CatalogChange.PRODUCT)
+    )
+    categories = Category.objects.in_bulk(live_ids(CatalogChange.CATEGORY))
+
+    changes = []
+    for (entity, object_id), entry in latest.items():
+        source = products if entity == CatalogChange.PRODUCT else categories
+        obj = source.get(object_id)
+        # Anything missing now was deleted by a later write; report it as such.
+        if obj is None:
+            changes.append({"type": entity, "id": object_id, "deleted": True})
+            continue
+        serializer = ProductSerializer if entity == CatalogChange.PRODUCT else CategorySerializer
+        changes.append(
+            {"type": entity, "id": object_id, "deleted": False, "data": serializer(obj).data}
+        )
+
+    if entries:
+        position = entries[-1].id
+    return Response(
+        {"changes": changes, "cursor": encode_feed_cursor(position), "has_more": has_more}
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def product_cache_stats(request):
+    return Response(product_cache.stats())
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def cart_list_create(request):
@@ -319,6 +584,23 @@ def cart_list_create(request):
         return Response(serializer.errors, status=400)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def cart_bulk_upsert(request):
+    serializer = CartSerializer(data=request.data, many=True)
+    if serializer.is_valid():
+        serializer.save(user=request.user)
+        carts = Cart.objects.select_related("user", "product").filter(user=request.user)
+        return Response(
+            {
+                "message": "Cart updated successfully",
+                "data": CartSerializer(carts, many=True).data,
+            },
+            status=200,
+        )
+    return Response(serializer.errors, status=400)
+
+
 @api_view(["GET", "DELETE", "PUT"])
 @permission_classes([IsAuthenticated, IsUserSelf])
 def cart_detail(request, cart_id):
@@ -355,13 +637,21 @@ def cart_detail(request, cart_id):
 @permission_classes([IsAuthenticated])
 def order_create(request):
     if request.method == "GET":
-        orders = Order.objects.filter(user=request.user).prefetch_related("items")
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        items = OrderItem.objects.only("id", "order_id", "product_id", "quantity", "price")
+        orders = Order.objects.filter(user=request.user).prefetch_related(
+            Prefetch("items", queryset=items)
+        )
+
+        filterset = OrderFilter(request.GET, queryset=orders)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=400)
+
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(filterset.qs, request)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     elif request.method == "POST":
-        # new one
-        cart_items = Cart.objects.filter(user=request.user)
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
@@ -374,6 +664,39 @@ def order_create(request):
     return Response({"message": "Invalid request"}, status=400)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def checkout(request):
+    try:
+        order = checkout_cart(request.user)
+    except EmptyCart:
+        return Response({"error": "Your cart is empty"}, status=400)
+    except InsufficientStock as exc:
+        return Response({"error": str(exc)}, status=400)
+
+    serializer = OrderSerializer(order)
+    return Response(
+        {"message": "Order created successfully", "data": serializer.data},
+        status=201,
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def order_bulk_cancel(request):
+    order_ids = request.data.get("order_ids")
+    if not isinstance(order_ids, list) or not all(
+        isinstance(order_id, int) for order_id in order_ids
+    ):
+        return Response({"error": "order_ids must be a list of ids"}, status=400)
+
+    cancelled = cancel_orders(order_ids)
+    return Response(
+        {"message": "Orders cancelled successfully", "cancelled": cancelled},
+        status=200,
+    )
+
+
 @api_view(["GET", "DELETE", "PUT"])
 @permission_classes([IsAuthenticated, IsUserSelf])
 def order_detail(request, order_id):